@@ -5,6 +5,10 @@ from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.tokens import AccessToken
 from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
 import json
+import time
+from .messaging import permission_error, content_error, mark_read
+from .serializers import MessageSerializer
+from . import presence, typing
 
 User = get_user_model()
 
@@ -17,6 +21,8 @@ class ChatConsumer(AsyncWebsocketConsumer):
             return
 
         self.user_group_name = f"user_{self.user.id}"
+        # receiver id -> monotonic time the last typing signal was forwarded
+        self.typing_sent = {}
 
         # Join room group
         await self.channel_layer.group_add(
@@ -25,6 +31,7 @@ class ChatConsumer(AsyncWebsocketConsumer):
         )
 
         await self.accept()
+        await database_sync_to_async(presence.connected)(self.user.id)
 
     async def disconnect(self, close_code):
         if hasattr(self, 'user_group_name'):
@@ -32,32 +39,133 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 self.user_group_name,
                 self.channel_name
             )
+            await database_sync_to_async(presence.disconnected)(self.user.id)
 
     async def receive(self, text_data):
         try:
             data = json.loads(text_data)
             msg_type = data.get('type')
 
-            if msg_type == 'typing':
-                receiver_id = data.get('receiver_id')
-                if receiver_id:
-                    # Forward typing signal to recipient
-                    await self.channel_layer.group_send(
-                        f"user_{receiver_id}",
-                        {
-                            'type': 'typing_signal',
-                            'sender_id': self.user.id
-                        }
-                    )
+            if msg_type == 'heartbeat':
+                # Keeps the user online, see chat.presence
+                await database_sync_to_async(presence.heartbeat)(self.user.id)
+
+            elif msg_type == 'send_message':
+                await self.send_chat_message(data)
+
+            elif msg_type == 'typing':
+                await self.forward_typing(data.get('receiver_id'))
+
+            elif msg_type == 'read':
+                await self.read_messages(data)
         except Exception as e:
             pass
 
+    async def send_chat_message(self, data):
+        """Handle a ``send_message`` frame and ack it over this socket.
+
+        Runs the same checks as ``ChatViewSet.create``. The message then goes
+        out to both users through the usual post_save fan-out.
+        """
+        client_id = data.get('client_id')
+        try:
+            receiver_id = int(data.get('receiver'))
+        except (TypeError, ValueError):
+            return await self.send_error(client_id, "Invalid receiver.")
+
+        error = await database_sync_to_async(permission_error)(self.user, receiver_id)
+        if error is None:
+            error = content_error(data.get('content') or '')
+        if error:
+            return await self.send_error(client_id, error)
+
+        message, errors = await self.save_message(receiver_id, data)
+        if errors:
+            return await self.send_error(client_id, errors)
+        await self.send(text_data=json.dumps({
+            'type': 'ack',
+            'client_id': client_id,
+            'message': message
+        }))
+
+    async def forward_typing(self, receiver_id):
+        try:
+            receiver_id = int(receiver_id)
+        except (TypeError, ValueError):
+            return
+        # Clients send a frame per keystroke burst; forward at most one per TYPING_DEBOUNCE
+        now = time.monotonic()
+        if now - self.typing_sent.get(receiver_id, 0) < typing.TYPING_DEBOUNCE:
+            return
+        self.typing_sent[receiver_id] = now
+
+        await database_sync_to_async(typing.mark_typing)(self.user.id, receiver_id)
+        # Forward typing signal to recipient
+        await self.channel_layer.group_send(
+            f"user_{receiver_id}",
+            {
+                'type': 'typing_signal',
+                'sender_id': self.user.id
+            }
+        )
+
+    async def read_messages(self, data):
+        """Handle a ``read`` frame sent while a conversation is open."""
+        try:
+            partner_id, message_id = int(data.get('user_id')), int(data.get('last_read_id'))
+        except (TypeError, ValueError):
+            return
+        await database_sync_to_async(mark_read)(self.user, partner_id, message_id)
+
+    @database_sync_to_async
+    def save_message(self, receiver_id, data):
+        serializer = MessageSerializer(data={
+            'content': data.get('content'),
+            'message_type': 'text',
+            'parent_message': data.get('parent_message'),
+        })
+        if not serializer.is_valid():
+            return None, serializer.errors
+        serializer.save(sender=self.user, receiver_id=receiver_id)
+        return serializer.data, None
+
+    async def send_error(self, client_id, error):
+        await self.send(text_data=json.dumps({
+            'type': 'error',
+            'client_id': client_id,
+            'error': error
+        }))
+
     async def chat_message(self, event):
         message = event['message']
         await self.send(text_data=json.dumps({
             'message': message
         }))
 
+    async def chat_batch(self, event):
+        # Several events for this user, folded into one channel layer send
+        for item in event['events']:
+            await self.dispatch(item)
+
+    async def inbox_update(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'inbox_update',
+            'conversation': event['conversation']
+        }))
+
+    async def read_receipt(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'read_receipt',
+            **event['receipt']
+        }))
+
+    async def call_update(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'call',
+            'kind': event['kind'],
+            'call': event['call']
+        }))
+
     async def typing_signal(self, event):
         await self.send(text_data=json.dumps({
             'type': 'typing',
@@ -0,0 +1,103 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer, InMemoryChannelLayer
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+# Fan-outs taking longer than this (queue wait plus send) are logged as warnings
+SLOW_FAN_OUT_MS = 50
+# Most queued events the worker drains into one round of sends
+MAX_BATCH = 200
+
+class Dispatcher:
+    """Sends channel layer events off the request thread.
+
+    A single daemon thread drains the queue, folds the events for each group
+    into one ``chat_batch`` event and sends to all groups concurrently. The
+    in-memory layer belongs to the server's event loop, so with it events are
+    sent inline instead.
+    """
+
+    def __init__(self):
+        self._queue = queue.SimpleQueue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def send(self, events):
+        """Queue ``(group, event)`` pairs for delivery."""
+        layer = get_channel_layer()
+        if layer is None or not events:
+            return
+        now = time.perf_counter()
+        if isinstance(layer, InMemoryChannelLayer):
+            try:
+                async_to_sync(self._send_groups)(layer, coalesce(events), now, len(events))
+            except Exception:
+                # The message is already saved, never fail the request over delivery
+                logger.exception("Chat fan-out failed")
+            return
+        self._start_worker()
+        for event in events:
+            self._queue.put((now, event))
+
+    def _start_worker(self):
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name='chat-dispatch', daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        layer = get_channel_layer()
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < MAX_BATCH:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            queued_at = min(t for t, _ in batch)
+            events = [e for _, e in batch]
+            try:
+                loop.run_until_complete(self._send_groups(layer, coalesce(events), queued_at, len(events)))
+            except Exception:
+                logger.exception("Chat fan-out failed")
+
+    async def _send_groups(self, layer, groups, queued_at, count):
+        started = time.perf_counter()
+        results = await asyncio.gather(
+            *(layer.group_send(group, event) for group, event in groups.items()),
+            return_exceptions=True
+        )
+        for group, result in zip(groups, results):
+            if isinstance(result, Exception):
+                logger.error("Chat fan-out to %s failed: %s", group, result)
+
+        finished = time.perf_counter()
+        queued_ms = (started - queued_at) * 1000
+        send_ms = (finished - started) * 1000
+        level = logging.WARNING if queued_ms + send_ms > SLOW_FAN_OUT_MS else logging.DEBUG
+        logger.log(level, "Chat fan-out of %d events to %d groups: %.1f ms queued, %.1f ms sending",
+                   count, len(groups), queued_ms, send_ms)
+
+def coalesce(events):
+    """Map each group to one event, wrapping several in a ``chat_batch``."""
+    by_group = {}
+    for group, event in events:
+        by_group.setdefault(group, []).append(event)
+    return {
+        group: items[0] if len(items) == 1 else {'type': 'chat_batch', 'events': items}
+        for group, items in by_group.items()
+    }
+
+dispatcher = Dispatcher()
+
+def send_on_commit(events):
+    """Queue ``(group, event)`` pairs once the current transaction commits."""
+    transaction.on_commit(lambda: dispatcher.send(events))
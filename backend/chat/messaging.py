@@ -0,0 +1,43 @@
+from matches.relationships import relationship
+from reports.content_filter import content_filter
+from .dispatch import send_on_commit
+from .models import Conversation
+from .serializers import inbox_update, read_receipt
+
+BLOCKED_ERROR = "You cannot message this user."
+NOT_MATCHED_ERROR = "You must match before chatting"
+
+def permission_error(sender, receiver_id):
+    """Return why ``sender`` may not message or call ``receiver_id``, or None if they may.
+
+    Shared by the REST endpoints and the websocket send path. The pair state
+    comes from ``matches.relationships``, so a warm conversation costs no
+    queries here.
+    """
+    state = relationship(sender.id, receiver_id)
+    if state is None:
+        return NOT_MATCHED_ERROR
+    # Check for block (or a banned side)
+    if state["blocked"]:
+        return BLOCKED_ERROR
+    # Check if matched before allowing chat
+    if not state["matched"]:
+        return NOT_MATCHED_ERROR
+    return None
+
+def content_error(content):
+    """Return why a message body is rejected, or None."""
+    return content_filter.error(content)
+
+def mark_read(reader, partner_id, message_id):
+    """Move ``reader``'s read cursor with ``partner_id`` up to ``message_id``.
+
+    Shared by history fetches and the websocket ``read`` frame. When the
+    cursor moves, the reader's other sockets get the cleared badge and the
+    partner gets a read receipt. Returns the conversation, or None if nothing
+    changed.
+    """
+    conversation = Conversation.objects.mark_read(reader, partner_id, message_id)
+    if conversation:
+        send_on_commit([inbox_update(conversation, reader.id), read_receipt(conversation, reader.id)])
+    return conversation
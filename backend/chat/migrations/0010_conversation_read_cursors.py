@@ -0,0 +1,93 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:48
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Exists, F, Func, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest, Least
+from chat.models import message_preview
+
+SIDES = (('low', 'user_low_id', 'user_high_id'), ('high', 'user_high_id', 'user_low_id'))
+
+
+def create_missing_conversations(ChatMessage, Conversation, batch_size=500):
+    """Add the rows backfill_conversations would, so every pair gets a cursor."""
+    existing = set(Conversation.objects.values_list('user_low_id', 'user_high_id'))
+    pairs = [
+        p for p in ChatMessage.objects
+            .annotate(low=Least('sender_id', 'receiver_id'), high=Greatest('sender_id', 'receiver_id'))
+            .exclude(low=F('high'))
+            .values('low', 'high')
+            .annotate(last_id=Max('id'))
+            .order_by('low', 'high')
+        if (p['low'], p['high']) not in existing
+    ]
+    for start in range(0, len(pairs), batch_size):
+        batch = pairs[start:start + batch_size]
+        last = ChatMessage.objects.in_bulk([p['last_id'] for p in batch])
+        Conversation.objects.bulk_create([
+            Conversation(
+                user_low_id=p['low'],
+                user_high_id=p['high'],
+                last_message=last[p['last_id']],
+                last_message_preview=message_preview(last[p['last_id']]),
+                last_message_at=last[p['last_id']].timestamp,
+            )
+            for p in batch
+        ])
+
+
+def is_read_to_cursors(apps, schema_editor):
+    ChatMessage = apps.get_model('chat', 'ChatMessage')
+    Conversation = apps.get_model('chat', 'Conversation')
+    # is_read is dropped below, so pairs without a row yet would lose their read state
+    create_missing_conversations(ChatMessage, Conversation)
+    for side, reader, partner in SIDES:
+        to_side = ChatMessage.objects.filter(sender_id=OuterRef(partner), receiver_id=OuterRef(reader)).order_by()
+        # Newest read message; older unread stragglers count as read from now on
+        Conversation.objects.update(**{f'{side}_read_id': Coalesce(
+            Subquery(to_side.filter(is_read=True).annotate(newest=Func('id', function='MAX')).values('newest')), 0
+        )})
+        Conversation.objects.update(**{f'{side}_unread_count': Subquery(
+            to_side.filter(id__gt=OuterRef(f'{side}_read_id')).annotate(count=Func('id', function='COUNT')).values('count')
+        )})
+
+
+def cursors_to_is_read(apps, schema_editor):
+    ChatMessage = apps.get_model('chat', 'ChatMessage')
+    Conversation = apps.get_model('chat', 'Conversation')
+    for side, reader, partner in SIDES:
+        ChatMessage.objects.filter(Exists(Conversation.objects.filter(**{
+            reader: OuterRef('receiver_id'),
+            partner: OuterRef('sender_id'),
+            f'{side}_read_id__gte': OuterRef('id'),
+        }))).update(is_read=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0009_call_call_receiver_status_idx_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='high_read_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='conversation',
+            name='low_read_id',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['sender', 'receiver', 'id'], name='chat_pair_id_idx'),
+        ),
+        migrations.RunPython(is_read_to_cursors, cursors_to_is_read),
+        migrations.RemoveField(
+            model_name='chatmessage',
+            name='is_read',
+        ),
+    ]
@@ -1,6 +1,9 @@
 
-from django.db import models
+from django.db import models, transaction, IntegrityError
+from django.db.models import F, Case, When, Value, Func, Subquery, OuterRef
+from django.db.models.functions import Now
 from django.conf import settings
+from matches.models import ordered_pair
 
 class ChatMessage(models.Model):
     MESSAGE_TYPES = (
@@ -15,12 +18,147 @@ class ChatMessage(models.Model):
     content = models.TextField(blank=True, null=True) # For text
     voice_file = models.FileField(upload_to='chat_voice/', blank=True, null=True)
     timestamp = models.DateTimeField(auto_now_add=True)
-    is_read = models.BooleanField(default=False)
     parent_message = models.ForeignKey('self', on_delete=models.SET_NULL, null=True, blank=True, related_name='replies')
+
+    class Meta:
+        indexes = [
+            # Each direction of a conversation, in time order, for history pages
+            models.Index(fields=['sender', 'receiver', 'timestamp'], name='chat_pair_timestamp_idx'),
+            # Unread counts, i.e. messages past a conversation's read cursor
+            models.Index(fields=['sender', 'receiver', 'id'], name='chat_pair_id_idx'),
+        ]
     
     def __str__(self):
         return f"Message from {self.sender} to {self.receiver}"
 
+# Longest message preview stored on a conversation
+PREVIEW_LENGTH = 255
+
+def message_preview(message):
+    return (message.content or '')[:PREVIEW_LENGTH] if message.message_type == 'text' else "Voice message"
+
+def unread_count(side, read_id=None):
+    """Subquery counting the messages to one side of a conversation past ``read_id``.
+
+    ``side`` is 'low' or 'high'; ``read_id`` defaults to that side's stored
+    read cursor. Served by chat_pair_id_idx.
+    """
+    reader, partner = ('user_low_id', 'user_high_id') if side == 'low' else ('user_high_id', 'user_low_id')
+    return Subquery(
+        ChatMessage.objects.filter(
+            sender_id=OuterRef(partner),
+            receiver_id=OuterRef(reader),
+            id__gt=OuterRef(f'{side}_read_id') if read_id is None else read_id,
+        ).order_by().annotate(count=Func('id', function='COUNT')).values('count')
+    )
+
+class ConversationManager(models.Manager):
+    def for_user(self, user):
+        return self.filter(models.Q(user_low=user) | models.Q(user_high=user))
+
+    def between(self, a_id, b_id):
+        low, high = ordered_pair(a_id, b_id)
+        return self.filter(user_low_id=low, user_high_id=high)
+
+    def record_message(self, message):
+        """Fold a new message into its conversation row with a single UPDATE.
+
+        Creates the row on the first message. The last-message fields only
+        move forward, so messages committed out of order cannot roll them back.
+        Returns the updated conversation.
+        """
+        low, high = ordered_pair(message.sender_id, message.receiver_id)
+        unread_field = 'low_unread_count' if message.receiver_id == low else 'high_unread_count'
+        newer = models.Q(last_message_id__gt=message.id)
+
+        def update():
+            return self.filter(user_low_id=low, user_high_id=high).update(**{
+                'last_message_id': Case(When(newer, then=F('last_message_id')), default=Value(message.id)),
+                'last_message_preview': Case(When(newer, then=F('last_message_preview')), default=Value(message_preview(message))),
+                'last_message_at': Case(When(newer, then=F('last_message_at')), default=Value(message.timestamp)),
+                unread_field: F(unread_field) + 1,
+                'updated_at': Now(),
+            })
+
+        if update():
+            return self.get(user_low_id=low, user_high_id=high)
+        try:
+            with transaction.atomic():
+                return self.create(
+                    user_low_id=low, user_high_id=high,
+                    last_message=message,
+                    last_message_preview=message_preview(message),
+                    last_message_at=message.timestamp,
+                    **{unread_field: 1}
+                )
+        except IntegrityError:
+            # Another writer created the row first
+            update()
+            return self.get(user_low_id=low, user_high_id=high)
+
+    def mark_read(self, reader, partner_id, message_id):
+        """Move the reader's read cursor forward to ``message_id``.
+
+        One conditional UPDATE that also recounts the reader's unread
+        messages past the new cursor. Returns the updated conversation, or
+        None if the cursor was already there or ``message_id`` is unknown.
+        """
+        low, high = ordered_pair(reader.id, partner_id)
+        side = 'low' if reader.id == low else 'high'
+        conversations = self.filter(user_low_id=low, user_high_id=high)
+        # A cursor past the last message would hide messages not sent yet
+        moved = conversations.filter(**{f'{side}_read_id__lt': message_id, 'last_message_id__gte': message_id}).update(**{
+            f'{side}_read_id': message_id,
+            f'{side}_unread_count': unread_count(side, message_id),
+            'updated_at': Now(),
+        })
+        return conversations.first() if moved else None
+
+class Conversation(models.Model):
+    """Inbox row per user pair, kept current on every message write."""
+    # Stored with user_low.id < user_high.id, like matches.Match
+    user_low = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='conversations_as_low')
+    user_high = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='conversations_as_high')
+    last_message = models.ForeignKey(ChatMessage, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    last_message_preview = models.CharField(max_length=PREVIEW_LENGTH, blank=True)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    # Newest message id each side has read up to
+    low_read_id = models.PositiveBigIntegerField(default=0)
+    high_read_id = models.PositiveBigIntegerField(default=0)
+    # Messages to each side past its read cursor
+    low_unread_count = models.PositiveIntegerField(default=0)
+    high_unread_count = models.PositiveIntegerField(default=0)
+    # Any change to the row, for inbox catch-up after a reconnect
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ConversationManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='unique_conversation_pair'),
+        ]
+        indexes = [
+            models.Index(fields=['user_low', '-last_message_at'], name='conversation_low_recent_idx'),
+            models.Index(fields=['user_high', '-last_message_at'], name='conversation_high_recent_idx'),
+            models.Index(fields=['user_low', 'updated_at'], name='conversation_low_updated_idx'),
+            models.Index(fields=['user_high', 'updated_at'], name='conversation_high_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"Conversation {self.user_low_id} <-> {self.user_high_id}"
+
+    def partner_id(self, user_id):
+        return self.user_high_id if user_id == self.user_low_id else self.user_low_id
+
+    def unread_count(self, user_id):
+        return self.low_unread_count if user_id == self.user_low_id else self.high_unread_count
+
+    def read_id(self, user_id):
+        return self.low_read_id if user_id == self.user_low_id else self.high_read_id
+
+    def is_read(self, message):
+        return message.id <= self.read_id(message.receiver_id)
+
 class Call(models.Model):
     STATUS_CHOICES = (
         ('initiated', 'Initiated'),
@@ -36,5 +174,12 @@ class Call(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # CallViewSet.poll, the fallback for clients without a socket
+            models.Index(fields=['receiver', 'status', 'created_at'], name='call_receiver_status_idx'),
+            models.Index(fields=['caller', 'updated_at'], name='call_caller_updated_idx'),
+        ]
+
     def __str__(self):
         return f"Call {self.caller} -> {self.receiver} ({self.status})"
@@ -0,0 +1,111 @@
+import atexit
+import threading
+import time
+from django.core.cache import cache
+from django.db.models import Case, When, Value, DateTimeField
+from django.utils import timezone
+from users.models import User
+
+# A socket that has not sent a heartbeat for this long no longer counts as online
+PRESENCE_TTL = 60
+# Seconds between last_activity flushes from one process
+FLUSH_INTERVAL = 5 * 60
+# Users written per UPDATE; each costs three bound parameters
+FLUSH_CHUNK = 200
+
+def _online_key(user_id):
+    return f"presence:{user_id}"
+
+def _seen_key(user_id):
+    return f"presence_seen:{user_id}"
+
+# user id -> last seen, waiting for the next flush to users_user
+_pending = {}
+_pending_lock = threading.Lock()
+_last_flush = time.monotonic()
+
+def connected(user_id):
+    """Count one more open socket for the user."""
+    key = _online_key(user_id)
+    cache.add(key, 0, PRESENCE_TTL)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Expired between add and incr
+        cache.set(key, 1, PRESENCE_TTL)
+    cache.touch(key, PRESENCE_TTL)
+    _seen(user_id)
+
+def heartbeat(user_id):
+    if not cache.touch(_online_key(user_id), PRESENCE_TTL):
+        # The key lapsed (missed heartbeats or a cache restart), count this socket again
+        cache.set(_online_key(user_id), 1, PRESENCE_TTL)
+    _seen(user_id)
+
+def disconnected(user_id):
+    key = _online_key(user_id)
+    try:
+        if cache.decr(key) <= 0:
+            cache.delete(key)
+    except ValueError:
+        pass
+    _seen(user_id)
+    # A quiet process may see no further events, so leaving writes now
+    flush_if_due(force=True)
+
+def _seen(user_id):
+    now = timezone.now()
+    cache.set(_seen_key(user_id), now, None)
+    with _pending_lock:
+        _pending[user_id] = now
+    flush_if_due()
+
+def flush_if_due(force=False):
+    """Write buffered last-seen times to ``User.last_activity``.
+
+    Runs at most every FLUSH_INTERVAL per process unless forced (on
+    disconnect and at exit), as one UPDATE per FLUSH_CHUNK users setting each
+    user's own time, so presence never writes to the user row per request.
+    """
+    global _last_flush
+    with _pending_lock:
+        if not _pending or (not force and time.monotonic() - _last_flush < FLUSH_INTERVAL):
+            return
+        pending = list(_pending.items())
+        _pending.clear()
+        _last_flush = time.monotonic()
+    for start in range(0, len(pending), FLUSH_CHUNK):
+        chunk = dict(pending[start:start + FLUSH_CHUNK])
+        User.objects.filter(pk__in=list(chunk)).update(last_activity=Case(
+            *(When(pk=user_id, then=Value(seen)) for user_id, seen in chunk.items()),
+            output_field=DateTimeField()
+        ))
+
+atexit.register(flush_if_due, force=True)
+
+def lookup(user_ids):
+    """Return ``{user_id: {"is_online", "last_seen"}}`` in one cache round trip.
+
+    Users never seen since the cache was cleared fall back to last_activity.
+    """
+    user_ids = list(user_ids)
+    keys = {}
+    for user_id in user_ids:
+        keys[_online_key(user_id)] = user_id
+        keys[_seen_key(user_id)] = user_id
+    found = cache.get_many(keys)
+
+    result = {}
+    missing = []
+    for user_id in user_ids:
+        last_seen = found.get(_seen_key(user_id))
+        if last_seen is None:
+            missing.append(user_id)
+        result[user_id] = {
+            "is_online": found.get(_online_key(user_id), 0) > 0,
+            "last_seen": last_seen
+        }
+    if missing:
+        for user_id, last_activity in User.objects.filter(pk__in=missing).values_list('id', 'last_activity'):
+            result[user_id]["last_seen"] = last_activity
+    return result
@@ -0,0 +1,81 @@
+from rest_framework import serializers
+from .models import ChatMessage
+from .voice import voice_url
+
+_timestamp = serializers.DateTimeField()
+
+def reply_preview(parent):
+    if parent is None:
+        return None
+    return {
+        "id": parent.id,
+        "content": parent.content,
+        "sender": parent.sender.first_name
+    }
+
+def message_to_dict(message):
+    """Plain dict for a message, shared by the REST API and the websocket fan-out.
+
+    Built once per instance and cached on it. Load messages with
+    ``select_related('parent_message__sender')`` so the reply preview costs
+    no queries.
+    """
+    payload = getattr(message, '_payload', None)
+    if payload is None:
+        payload = message._payload = {
+            "id": message.id,
+            "sender": message.sender_id,
+            "receiver": message.receiver_id,
+            "message_type": message.message_type,
+            "content": message.content,
+            "voice_file": voice_url(message) if message.voice_file else None,
+            "timestamp": _timestamp.to_representation(message.timestamp),
+            # New messages are unread; history pages fill this in from the conversation's read cursors
+            "is_read": False,
+            "parent_message": message.parent_message_id,
+            "reply_to": reply_preview(message.parent_message),
+        }
+    return payload
+
+def inbox_entry(conversation, user_id):
+    """What ``user_id``'s inbox needs to know about a changed conversation."""
+    return {
+        "user_id": conversation.partner_id(user_id),
+        "last_msg": conversation.last_message_preview,
+        "time": _timestamp.to_representation(conversation.last_message_at) if conversation.last_message_at else None,
+        "unread_count": conversation.unread_count(user_id)
+    }
+
+def inbox_update(conversation, user_id):
+    """``(group, event)`` pushing a conversation change to one user's sockets."""
+    return (f"user_{user_id}", {'type': 'inbox_update', 'conversation': inbox_entry(conversation, user_id)})
+
+def read_receipt(conversation, reader_id):
+    """``(group, event)`` telling the other side how far ``reader_id`` has read."""
+    return (f"user_{conversation.partner_id(reader_id)}", {
+        'type': 'read_receipt',
+        'receipt': {"user_id": reader_id, "last_read_id": conversation.read_id(reader_id)}
+    })
+
+class MessageSerializer(serializers.ModelSerializer):
+    # The reply preview needs the parent's sender, so fetch both in one query
+    parent_message = serializers.PrimaryKeyRelatedField(
+        queryset=ChatMessage.objects.select_related('sender'), required=False, allow_null=True
+    )
+
+    class Meta:
+        model = ChatMessage
+        fields = '__all__'
+        # The views check the receiver against the cached pair state and pass receiver_id to save().
+        # Audio only arrives through VoiceUploadView, which enforces the size cap.
+        read_only_fields = ('sender', 'receiver', 'timestamp', 'voice_file')
+
+    def to_representation(self, instance):
+        data = dict(message_to_dict(instance))
+        conversation = self.context.get('conversation')
+        if conversation is not None:
+            data['is_read'] = conversation.is_read(instance)
+        request = self.context.get('request')
+        if data['voice_file'] and request is not None:
+            data['voice_file'] = request.build_absolute_uri(data['voice_file'])
+        return data
@@ -1,3 +1,749 @@
-from django.test import TestCase
+import datetime
+import shutil
+import tempfile
+from unittest import mock
+from io import BytesIO, StringIO
+from django.db import connection, DatabaseError
+from django.core.cache import cache
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from users.models import User
+from matches.models import Match
+from profiles.models import UserPhoto
+from django.core.management import call_command
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from rest_framework_simplejwt.tokens import AccessToken
+from matches.models import Swipe
+from matches.swipes import record_swipes
+from reports.models import Block
+from .models import ChatMessage, Conversation
+from .dispatch import coalesce, dispatcher
+from .consumers import ChatConsumer
+from . import presence, typing, voice
 
-# Create your tests here.
+class CacheTestCase(TestCase):
+    """Starts each test with an empty cache.
+
+    The cache outlives each test's transaction, so pair, presence and typing
+    state from earlier tests could otherwise sit under reused ids.
+    """
+
+    def setUp(self):
+        cache.clear()
+
+class ChatQueryCountTests(CacheTestCase):
+    """Locks the number of queries of the chat write path."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(email='me@example.com', password='pass1234')
+        self.partner = User.objects.create_user(email='partner@example.com', password='pass1234')
+        self.stranger = User.objects.create_user(email='stranger@example.com', password='pass1234')
+        Match.objects.create_pair(self.user, self.partner)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_send_to_match(self):
+        self.client.post('/api/messages/', {'receiver': self.partner.id, 'content': 'Hey'})
+        # Pair state is cached: insert, conversation update and read back
+        with self.assertNumQueries(3):
+            res = self.client.post('/api/messages/', {'receiver': self.partner.id, 'content': 'Hi'})
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(ChatMessage.objects.count(), 2)
+
+    def test_send_to_stranger_is_rejected(self):
+        # One query loads the whole pair state
+        with self.assertNumQueries(1):
+            res = self.client.post('/api/messages/', {'receiver': self.stranger.id, 'content': 'Hi'})
+        self.assertEqual(res.status_code, 403)
+
+class ChatListQueryCountTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='me@example.com', password='pass1234')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_inbox_is_one_query_regardless_of_history(self):
+        partners = [User.objects.create_user(email=f'p{i}@example.com', password='pass1234') for i in range(4)]
+        for i, partner in enumerate(partners):
+            UserPhoto.objects.create(user=partner, image=f'profile_photos/{i}.jpg', is_primary=True)
+            for _ in range(3):
+                ChatMessage.objects.create(sender=partner, receiver=self.user, content='Hi')
+            ChatMessage.objects.create(sender=self.user, receiver=partner, content=f'Reply {i}')
+
+        with self.assertNumQueries(1):
+            res = self.client.get('/api/chats/')
+
+        self.assertEqual([c['user_id'] for c in res.data], [p.id for p in reversed(partners)])
+        self.assertEqual({c['unread_count'] for c in res.data}, {3})
+        self.assertEqual(res.data[0]['last_msg'], 'Reply 3')
+        self.assertEqual(res.data[0]['photo'], '/media/profile_photos/3.jpg')
+
+class ConversationTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(email='me@example.com', password='pass1234')
+        self.partner = User.objects.create_user(email='partner@example.com', password='pass1234')
+        Match.objects.create_pair(self.user, self.partner)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def conversation(self):
+        return Conversation.objects.between(self.user.id, self.partner.id).get()
+
+    def unread_for(self, conversation, user):
+        return conversation.low_unread_count if user.id == conversation.user_low_id else conversation.high_unread_count
+
+    def test_message_write_updates_conversation(self):
+        ChatMessage.objects.create(sender=self.partner, receiver=self.user, content='Hi')
+        last = ChatMessage.objects.create(sender=self.partner, receiver=self.user, message_type='voice')
+
+        conversation = self.conversation()
+        self.assertEqual(conversation.last_message_id, last.id)
+        self.assertEqual(conversation.last_message_preview, 'Voice message')
+        self.assertEqual(self.unread_for(conversation, self.user), 2)
+        self.assertEqual(self.unread_for(conversation, self.partner), 0)
+
+    def test_reading_resets_unread_count(self):
+        for _ in range(3):
+            ChatMessage.objects.create(sender=self.partner, receiver=self.user, content='Hi')
+
+        self.client.get('/api/messages/', {'user_id': self.partner.id})
+        self.assertEqual(self.unread_for(self.conversation(), self.user), 0)
+
+    def test_backfill_matches_live_updates(self):
+        first = ChatMessage.objects.create(sender=self.partner, receiver=self.user, content='Hi')
+        ChatMessage.objects.create(sender=self.user, receiver=self.partner, content='Hello')
+        ChatMessage.objects.create(sender=self.partner, receiver=self.user, content='How are you?')
+        Conversation.objects.mark_read(self.user, self.partner.id, first.id)
+        live = self.conversation()
+
+        Conversation.objects.update(last_message=None, last_message_preview='', low_unread_count=0, high_unread_count=0)
+        call_command('backfill_conversations', stdout=StringIO())
+
+        rebuilt = self.conversation()
+        for field in (
+            'last_message_id', 'last_message_preview', 'last_message_at',
+            'low_read_id', 'high_read_id', 'low_unread_count', 'high_unread_count',
+        ):
+            self.assertEqual(getattr(rebuilt, field), getattr(live, field))
+
+    def test_backfilled_rows_start_read(self):
+        for _ in range(3):
+            ChatMessage.objects.create(sender=self.partner, receiver=self.user, content='Hi')
+        Conversation.objects.all().delete()
+        call_command('backfill_conversations', stdout=StringIO())
+
+        # No read state survives without the row; history must not all turn unread
+        conversation = self.conversation()
+        self.assertEqual(self.unread_for(conversation, self.user), 0)
+        self.assertEqual(conversation.read_id(self.user.id), conversation.last_message_id)
+
+class ReadCursorTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='me@example.com', password='pass1234')
+        self.partner = User.objects.create_user(email='partner@example.com', password='pass1234')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.layer = get_channel_layer()
+        self.channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(f"user_{self.partner.id}", self.channel)
+
+    def tearDown(self):
+        async_to_sync(self.layer.flush)()
+
+    def read(self, **params):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            res = self.client.get('/api/messages/', {'user_id': self.partner.id, **params})
+        return res, callbacks
+
+    def test_reading_sends_a_receipt_to_the_partner(self):
+        ChatMessage.objects.create(sender=self.partner, receiver=self.user, content='Hi')
+        last = ChatMessage.objects.create(sender=self.partner, receiver=self.user, content='Hello?')
+
+        res, _ = self.read()
+        self.assertEqual([m['is_read'] for m in res.data['messages']], [True, True])
+        self.assertEqual(self.receive_receipt(), {
+            'type': 'read_receipt', 'receipt': {'user_id': self.user.id, 'last_read_id': last.id}
+        })
+        conversation = Conversation.objects.between(self.user.id, self.partner.id).get()
+        self.assertEqual(conversation.read_id(self.user.id), last.id)
+        self.assertEqual(conversation.unread_count(self.user.id), 0)
+
+        # An older page does not move the cursor back
+        self.read(before_id=last.id)
+        self.assertEqual(Conversation.objects.get(pk=conversation.pk).read_id(self.user.id), last.id)
+
+    def test_nothing_new_writes_nothing(self):
+        ChatMessage.objects.create(sender=self.partner, receiver=self.user, content='Hi')
+        self.read()
+        self.receive_receipt()
+
+        mine = ChatMessage.objects.create(sender=self.user, receiver=self.partner, content='Hey')
+        with CaptureQueriesContext(connection) as queries:
+            res, callbacks = self.read()
+        # No receipt, and no per-message read flags to flip
+        self.assertEqual(callbacks, [])
+        self.assertFalse([q for q in queries.captured_queries if q['sql'].startswith('UPDATE "chat_chatmessage"')])
+        # The partner has not read the reply yet
+        self.assertEqual([(m['id'], m['is_read']) for m in res.data['messages']][-1], (mine.id, False))
+
+    def test_unread_count_follows_the_cursor(self):
+        ChatMessage.objects.create(sender=self.partner, receiver=self.user, content='Hi')
+        self.read()
+        ChatMessage.objects.create(sender=self.partner, receiver=self.user, content='Still there?')
+        ChatMessage.objects.create(sender=self.partner, receiver=self.user, content='Hello?')
+
+        conversation = Conversation.objects.between(self.user.id, self.partner.id).get()
+        self.assertEqual(conversation.unread_count(self.user.id), 2)
+
+    def test_read_frame_moves_the_cursor(self):
+        message = ChatMessage.objects.create(sender=self.partner, receiver=self.user, content='Hi')
+
+        async def run():
+            token = str(AccessToken.for_user(self.user))
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), f"/ws/chat/?token={token}")
+            await communicator.connect()
+            # An id past the last message is ignored
+            await communicator.send_json_to({'type': 'read', 'user_id': self.partner.id, 'last_read_id': message.id + 1})
+            await communicator.send_json_to({'type': 'read', 'user_id': self.partner.id, 'last_read_id': message.id})
+            await communicator.receive_nothing()
+            await communicator.disconnect()
+        async_to_sync(run)()
+
+        conversation = Conversation.objects.between(self.user.id, self.partner.id).get()
+        self.assertEqual(conversation.read_id(self.user.id), message.id)
+        self.assertEqual(conversation.unread_count(self.user.id), 0)
+
+    def receive_receipt(self):
+        events = async_to_sync(self.layer.receive)(self.channel)
+        return next(e for e in events.get('events', [events]) if e['type'] == 'read_receipt')
+
+class ReadCursorMigrationTests(TransactionTestCase):
+    """Read flags must survive the move to per-side cursors."""
+
+    before = [('chat', '0005_alter_chatmessage_message_type')]
+    after = [('chat', '0010_conversation_read_cursors')]
+
+    def migrate(self, targets):
+        executor = MigrationExecutor(connection)
+        executor.migrate(targets)
+        return executor.loader.project_state(targets).apps
+
+    def tearDown(self):
+        call_command('migrate', verbosity=0)
+
+    def test_read_messages_stay_read(self):
+        low = User.objects.create_user(email='low@example.com', password='pass1234')
+        high = User.objects.create_user(email='high@example.com', password='pass1234')
+        OldMessage = self.migrate(self.before).get_model('chat', 'ChatMessage')
+        sent = [OldMessage.objects.create(sender_id=low.id, receiver_id=high.id, content=f'Hi {i}', is_read=i < 5) for i in range(7)]
+        OldMessage.objects.create(sender_id=high.id, receiver_id=low.id, content='Hey', is_read=False)
+
+        Conversation = self.migrate(self.after).get_model('chat', 'Conversation')
+        conversation = Conversation.objects.get(user_low_id=low.id, user_high_id=high.id)
+        self.assertEqual((conversation.high_read_id, conversation.high_unread_count), (sent[4].id, 2))
+        self.assertEqual((conversation.low_read_id, conversation.low_unread_count), (0, 1))
+        self.assertEqual(conversation.last_message_preview, 'Hey')
+
+class MessageHistoryTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='me@example.com', password='pass1234')
+        self.partner = User.objects.create_user(email='partner@example.com', password='pass1234')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.ids = [
+            ChatMessage.objects.create(sender=sender, receiver=receiver, content=str(i)).id
+            for i, (sender, receiver) in enumerate([(self.user, self.partner), (self.partner, self.user)] * 5)
+        ]
+
+    def page(self, **params):
+        res = self.client.get('/api/messages/', {'user_id': self.partner.id, **params})
+        self.assertEqual(res.status_code, 200)
+        return [m['id'] for m in res.data['messages']], res.data['has_more']
+
+    def test_walks_back_through_history(self):
+        self.assertEqual(self.page(limit=4), (self.ids[-4:], True))
+        self.assertEqual(self.page(limit=4, before_id=self.ids[-4]), (self.ids[2:6], True))
+        self.assertEqual(self.page(limit=4, before_id=self.ids[2]), (self.ids[:2], False))
+
+    def test_delta_returns_only_newer_messages(self):
+        self.assertEqual(self.page(after_id=self.ids[-1]), ([], False))
+        new = ChatMessage.objects.create(sender=self.partner, receiver=self.user, content='new')
+        self.assertEqual(self.page(after_id=self.ids[-1]), ([new.id], False))
+        self.assertEqual(self.page(after_id=self.ids[6], limit=2), (self.ids[7:9], True))
+
+    def test_deleted_cursor_message(self):
+        ChatMessage.objects.filter(pk=self.ids[-1]).delete()
+        new = ChatMessage.objects.create(sender=self.partner, receiver=self.user, content='new')
+        self.assertEqual(self.page(after_id=self.ids[-1]), ([new.id], False))
+
+    def test_cursors_outside_the_history(self):
+        # A delta sync from 0 gets everything, a cursor past the newest the latest page
+        self.assertEqual(self.page(after_id=0), (self.ids, False))
+        self.assertEqual(self.page(after_id=0, limit=4), (self.ids[:4], True))
+        self.assertEqual(self.page(before_id=self.ids[-1] + 100, limit=4), (self.ids[-4:], True))
+
+    def test_invalid_cursor(self):
+        res = self.client.get('/api/messages/', {'user_id': self.partner.id, 'before_id': 'x'})
+        self.assertEqual(res.status_code, 400)
+
+class MessagePayloadQueryTests(CacheTestCase):
+    """Replies must not cost extra queries on the chat read and write paths."""
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(email='me@example.com', password='pass1234', first_name='Me')
+        self.partner = User.objects.create_user(email='partner@example.com', password='pass1234')
+        Match.objects.create_pair(self.user, self.partner)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.parent = ChatMessage.objects.create(sender=self.user, receiver=self.partner, content='Question')
+
+    def add_replies(self, n):
+        for i in range(n):
+            ChatMessage.objects.create(sender=self.partner, receiver=self.user, content=f'Answer {i}', parent_message=self.parent)
+
+    def test_history_page_queries_do_not_grow_with_replies(self):
+        self.add_replies(2)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get('/api/messages/', {'user_id': self.partner.id})
+
+        self.add_replies(20)
+        # page, read cursor update, conversation, partner last seen
+        with self.assertNumQueries(len(few)):
+            res = self.client.get('/api/messages/', {'user_id': self.partner.id})
+        self.assertEqual(len(few), 4)
+        self.assertFalse([q for q in few.captured_queries if q['sql'].startswith('UPDATE "users_user"')])
+
+        reply = res.data['messages'][-1]
+        self.assertEqual(reply['reply_to'], {'id': self.parent.id, 'content': 'Question', 'sender': 'Me'})
+
+    def test_sending_a_reply(self):
+        # pair state, parent lookup, insert, conversation update and read back
+        with self.assertNumQueries(5):
+            res = self.client.post('/api/messages/', {
+                'receiver': self.partner.id, 'content': 'Hi', 'parent_message': self.parent.id
+            })
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(res.data['reply_to']['sender'], 'Me')
+
+class FanOutTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='me@example.com', password='pass1234')
+        self.partner = User.objects.create_user(email='partner@example.com', password='pass1234')
+        self.layer = get_channel_layer()
+        self.channel = async_to_sync(self.layer.new_channel)()
+        async_to_sync(self.layer.group_add)(f"user_{self.partner.id}", self.channel)
+
+    def tearDown(self):
+        async_to_sync(self.layer.flush)()
+
+    def receive(self):
+        return async_to_sync(self.layer.receive)(self.channel)
+
+    def test_sent_only_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            message = ChatMessage.objects.create(sender=self.user, receiver=self.partner, content='Hi')
+        # Nothing goes out until the transaction commits
+        self.assertNotIn(self.channel, self.layer.channels)
+        self.assertEqual(len(callbacks), 1)
+
+        for callback in callbacks:
+            callback()
+        # The message and the inbox update go out together
+        new_message, inbox = self.receive()['events']
+        self.assertEqual(new_message['type'], 'chat_message')
+        self.assertEqual(new_message['message']['id'], message.id)
+        self.assertFalse(new_message['message']['is_me'])
+        self.assertEqual(inbox['type'], 'inbox_update')
+        self.assertEqual(inbox['conversation'], {
+            'user_id': self.user.id, 'last_msg': 'Hi', 'time': new_message['message']['timestamp'], 'unread_count': 1
+        })
+
+    def test_burst_is_coalesced_per_group(self):
+        events = [(f"user_{self.partner.id}", {'type': 'chat_message', 'message': {'id': i}}) for i in range(3)]
+        events.append(("user_0", {'type': 'chat_message', 'message': {'id': 99}}))
+        groups = coalesce(events)
+
+        self.assertEqual(groups["user_0"]['type'], 'chat_message')
+        batch = groups[f"user_{self.partner.id}"]
+        self.assertEqual(batch['type'], 'chat_batch')
+        self.assertEqual([e['message']['id'] for e in batch['events']], [0, 1, 2])
+
+        dispatcher.send(events)
+        self.assertEqual(self.receive(), batch)
+
+class ConsumerSendMessageTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(email='me@example.com', password='pass1234')
+        self.partner = User.objects.create_user(email='partner@example.com', password='pass1234')
+        self.stranger = User.objects.create_user(email='stranger@example.com', password='pass1234')
+        Match.objects.create_pair(self.user, self.partner)
+        self.token = str(AccessToken.for_user(self.user))
+
+    def exchange(self, *frames):
+        async def run():
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), f"/ws/chat/?token={self.token}")
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            replies = []
+            for frame in frames:
+                await communicator.send_json_to(frame)
+                reply = await communicator.receive_json_from()
+                # Skip the fan-out echo of our own message
+                while reply.get('type') not in ('ack', 'error'):
+                    reply = await communicator.receive_json_from()
+                replies.append(reply)
+            await communicator.disconnect()
+            return replies
+        return async_to_sync(run)()
+
+    def test_send_to_match_is_saved_and_acked(self):
+        ack, = self.exchange({'type': 'send_message', 'client_id': 7, 'receiver': self.partner.id, 'content': 'Hi'})
+        self.assertEqual(ack['type'], 'ack')
+        self.assertEqual(ack['client_id'], 7)
+        message = ChatMessage.objects.get()
+        self.assertEqual((message.sender, message.receiver, message.content), (self.user, self.partner, 'Hi'))
+        self.assertEqual(ack['message']['id'], message.id)
+
+    def test_same_checks_as_rest(self):
+        replies = self.exchange(
+            {'type': 'send_message', 'client_id': 1, 'receiver': self.stranger.id, 'content': 'Hi'},
+            {'type': 'send_message', 'client_id': 2, 'receiver': self.partner.id, 'content': 'me@example.com'},
+            {'type': 'send_message', 'client_id': 3, 'receiver': 'x', 'content': 'Hi'},
+        )
+        self.assertEqual([r['type'] for r in replies], ['error'] * 3)
+        self.assertEqual(replies[0]['error'], "You must match before chatting")
+        self.assertFalse(ChatMessage.objects.exists())
+
+    def test_permission_lookup_is_cached(self):
+        frame = {'type': 'send_message', 'receiver': self.partner.id, 'content': 'Hi'}
+        with CaptureQueriesContext(connection) as queries:
+            self.exchange(frame, frame)
+        block_checks = [q for q in queries if 'reports_block' in q['sql']]
+        self.assertEqual(len(block_checks), 1)
+        self.assertEqual(ChatMessage.objects.count(), 2)
+
+class InboxCatchUpTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='me@example.com', password='pass1234')
+        self.old = User.objects.create_user(email='old@example.com', password='pass1234')
+        self.recent = User.objects.create_user(email='recent@example.com', password='pass1234')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_since_returns_only_changed_conversations(self):
+        ChatMessage.objects.create(sender=self.old, receiver=self.user, content='Old')
+        ChatMessage.objects.create(sender=self.recent, receiver=self.user, content='Recent')
+        Conversation.objects.between(self.user.id, self.old.id).update(updated_at=timezone.now() - datetime.timedelta(hours=1))
+
+        res = self.client.get('/api/chats/', {'since': (timezone.now() - datetime.timedelta(minutes=1)).isoformat()})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([c['user_id'] for c in res.data['results']], [self.recent.id])
+        self.assertIn('server_time', res.data)
+
+    def test_reading_pushes_cleared_badge(self):
+        ChatMessage.objects.create(sender=self.old, receiver=self.user, content='Hi')
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.get('/api/messages/', {'user_id': self.old.id})
+        self.assertEqual(len(callbacks), 1)
+
+    def test_invalid_since(self):
+        self.assertEqual(self.client.get('/api/chats/', {'since': 'yesterday'}).status_code, 400)
+
+class PresenceTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        # Drop last-seen times buffered by earlier tests
+        presence.flush_if_due(force=True)
+        self.user = User.objects.create_user(email='me@example.com', password='pass1234')
+        self.partner = User.objects.create_user(email='partner@example.com', password='pass1234')
+        self.stranger = User.objects.create_user(email='stranger@example.com', password='pass1234')
+        Match.objects.create_pair(self.user, self.partner)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_online_while_any_socket_is_open(self):
+        presence.connected(self.partner.id)
+        presence.connected(self.partner.id)
+        presence.disconnected(self.partner.id)
+        self.assertTrue(presence.lookup([self.partner.id])[self.partner.id]['is_online'])
+
+        presence.disconnected(self.partner.id)
+        status_ = presence.lookup([self.partner.id])[self.partner.id]
+        self.assertFalse(status_['is_online'])
+        self.assertIsNotNone(status_['last_seen'])
+
+    def test_last_activity_is_flushed_in_one_update(self):
+        earlier = timezone.now() - datetime.timedelta(minutes=4)
+        with mock.patch('chat.presence.timezone.now', return_value=earlier):
+            presence.connected(self.user.id)
+        presence.connected(self.partner.id)
+        partner_seen = presence.lookup([self.partner.id])[self.partner.id]['last_seen']
+
+        with self.assertNumQueries(1):
+            presence.flush_if_due(force=True)
+        # Each user keeps their own last-seen time
+        self.assertEqual(
+            dict(User.objects.filter(pk__in=[self.user.id, self.partner.id]).values_list('id', 'last_activity')),
+            {self.user.id: earlier, self.partner.id: partner_seen}
+        )
+
+    def test_large_flushes_are_chunked(self):
+        for user in (self.user, self.partner, self.stranger):
+            presence.connected(user.id)
+        seen = {user_id: info['last_seen'] for user_id, info in presence.lookup([self.user.id, self.partner.id, self.stranger.id]).items()}
+
+        with mock.patch.object(presence, 'FLUSH_CHUNK', 2), self.assertNumQueries(2):
+            presence.flush_if_due(force=True)
+        self.assertEqual(dict(User.objects.filter(pk__in=seen).values_list('id', 'last_activity')), seen)
+
+    def test_disconnect_flushes_without_waiting(self):
+        presence.connected(self.partner.id)
+        presence.disconnected(self.partner.id)
+        self.partner.refresh_from_db()
+        self.assertEqual(self.partner.last_activity, presence.lookup([self.partner.id])[self.partner.id]['last_seen'])
+
+    def test_bulk_lookup_only_shows_matches(self):
+        presence.connected(self.partner.id)
+        presence.connected(self.stranger.id)
+        res = self.client.get('/api/presence/', {'user_ids': f'{self.partner.id},{self.stranger.id}'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(list(res.data), [str(self.partner.id)])
+        self.assertTrue(res.data[str(self.partner.id)]['is_online'])
+
+class TypingTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(email='me@example.com', password='pass1234')
+        self.partner = User.objects.create_user(email='partner@example.com', password='pass1234')
+        self.client = APIClient()
+        self.client.force_authenticate(self.partner)
+
+    def test_typing_shows_in_partner_status(self):
+        self.client.post('/api/chat/typing/', {'receiver_id': self.user.id})
+        self.client.force_authenticate(self.user)
+        res = self.client.get('/api/messages/', {'user_id': self.partner.id})
+        self.assertTrue(res.data['partner_status']['is_typing'])
+
+        cache.delete(f"typing:{self.partner.id}:{self.user.id}")
+        res = self.client.get('/api/messages/', {'user_id': self.partner.id})
+        self.assertFalse(res.data['partner_status']['is_typing'])
+
+    def test_websocket_typing_frames_are_debounced(self):
+        layer = get_channel_layer()
+        channel = async_to_sync(layer.new_channel)()
+        async_to_sync(layer.group_add)(f"user_{self.partner.id}", channel)
+        token = str(AccessToken.for_user(self.user))
+
+        async def run():
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), f"/ws/chat/?token={token}")
+            await communicator.connect()
+            for _ in range(5):
+                await communicator.send_json_to({'type': 'typing', 'receiver_id': self.partner.id})
+            # Round trip a heartbeat so every frame above has been handled
+            await communicator.send_json_to({'type': 'heartbeat'})
+            await communicator.receive_nothing(timeout=0.1)
+            await communicator.disconnect()
+        async_to_sync(run)()
+
+        self.assertEqual(layer.channels[channel].qsize(), 1)
+        self.assertTrue(typing.is_typing(self.user.id, self.partner.id))
+        async_to_sync(layer.flush)()
+
+class CallSignalingTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.caller = User.objects.create_user(email='caller@example.com', password='pass1234')
+        self.receiver = User.objects.create_user(email='receiver@example.com', password='pass1234')
+        Match.objects.create_pair(self.caller, self.receiver)
+        self.layer = get_channel_layer()
+        self.channels = {}
+        for user in (self.caller, self.receiver):
+            self.channels[user.id] = async_to_sync(self.layer.new_channel)()
+            async_to_sync(self.layer.group_add)(f"user_{user.id}", self.channels[user.id])
+        self.client = APIClient()
+
+    def tearDown(self):
+        async_to_sync(self.layer.flush)()
+
+    def call_events(self, user):
+        """Call events waiting for ``user``, unpacking batches."""
+        events = []
+        queue = self.layer.channels.get(self.channels[user.id])
+        while queue is not None and not queue.empty():
+            _, event = queue.get_nowait()
+            events.extend(event['events'] if event['type'] == 'chat_batch' else [event])
+        return [(e['kind'], e['call']['status']) for e in events if e['type'] == 'call_update']
+
+    def post(self, user, url, data=None):
+        self.client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(url, data or {})
+
+    def test_start_answer_end_are_pushed_to_both_sides(self):
+        call_id = self.post(self.caller, '/api/calls/start/', {'receiver': self.receiver.id, 'sdp_offer': 'offer'}).data['id']
+        self.assertEqual(self.call_events(self.receiver), [('incoming', 'initiated')])
+        self.assertEqual(self.call_events(self.caller), [('my_call', 'initiated')])
+
+        self.post(self.receiver, f'/api/calls/{call_id}/answer/', {'sdp_answer': 'answer'})
+        self.assertEqual(self.call_events(self.caller), [('my_call', 'active')])
+
+        self.post(self.caller, f'/api/calls/{call_id}/end/')
+        self.assertEqual(self.call_events(self.receiver), [('incoming_update', 'active'), ('incoming_update', 'ended')])
+
+    def test_restarting_ends_the_pending_call(self):
+        self.post(self.caller, '/api/calls/start/', {'receiver': self.receiver.id})
+        self.call_events(self.receiver)
+        self.post(self.caller, '/api/calls/start/', {'receiver': self.receiver.id})
+        self.assertEqual(self.call_events(self.receiver), [('incoming_update', 'ended'), ('incoming', 'initiated')])
+
+class PairRelationshipCacheTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(email='me@example.com', password='pass1234')
+        self.partner = User.objects.create_user(email='partner@example.com', password='pass1234')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def send(self):
+        return self.client.post('/api/messages/', {'receiver': self.partner.id, 'content': 'Hi'}).status_code
+
+    def test_match_block_and_ban_take_effect_immediately(self):
+        self.assertEqual(self.send(), 403)
+
+        # Matches from a batch swipe are bulk inserted, without post_save
+        Swipe.objects.create(swiper=self.partner, target=self.user, action='like')
+        with self.captureOnCommitCallbacks(execute=True):
+            record_swipes(self.user, {self.partner.id: 'like'})
+        self.assertEqual(self.send(), 201)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            block = Block.objects.create(blocker=self.partner, blocked_user=self.user)
+        self.assertEqual(self.send(), 403)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            block.delete()
+        self.assertEqual(self.send(), 201)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.partner.status = 'temp_banned'
+            self.partner.save()
+        self.assertEqual(self.send(), 403)
+
+    def test_calls_need_a_match(self):
+        res = self.client.post('/api/calls/start/', {'receiver': self.partner.id})
+        self.assertEqual(res.status_code, 403)
+        self.assertFalse(ChatMessage.objects.exists())
+
+class VoiceMessageTests(CacheTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        self.enterContext(override_settings(MEDIA_ROOT=media))
+        self.user = User.objects.create_user(email='me@example.com', password='pass1234')
+        self.partner = User.objects.create_user(email='partner@example.com', password='pass1234')
+        Match.objects.create_pair(self.user, self.partner)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.audio = bytes(range(256)) * 40
+
+    def upload(self, body=None, receiver=None, duration=3, content_type='audio/webm'):
+        url = f"/api/messages/voice/?receiver={receiver or self.partner.id}&duration={duration}"
+        with self.captureOnCommitCallbacks() as callbacks:
+            res = self.client.post(url, self.audio if body is None else body, content_type=content_type)
+        return res, callbacks
+
+    def test_upload_is_stored_and_sent(self):
+        res, callbacks = self.upload()
+        self.assertEqual(res.status_code, 201)
+        message = ChatMessage.objects.get()
+        self.assertEqual(message.message_type, 'voice')
+        self.assertTrue(message.voice_file.name.endswith('.webm'))
+        with message.voice_file.open() as stored:
+            self.assertEqual(stored.read(), self.audio)
+        self.assertEqual(res.data['voice_file'], 'http://testserver' + voice.voice_url(message))
+        # Fan-out and the background re-encode
+        self.assertEqual(len(callbacks), 2)
+
+    def test_codec_parameters_are_accepted(self):
+        # Browser recorders send the codec along with the type
+        res, _ = self.upload(content_type='audio/webm;codecs=opus')
+        self.assertEqual(res.status_code, 201)
+        self.assertTrue(ChatMessage.objects.get().voice_file.name.endswith('.webm'))
+        self.assertEqual(voice.media_type('Audio/Ogg; codecs="opus"'), 'audio/ogg')
+
+    def test_rejected_uploads(self):
+        stranger = User.objects.create_user(email='stranger@example.com', password='pass1234')
+        self.assertEqual(self.upload(receiver=stranger.id)[0].status_code, 403)
+        self.assertEqual(self.upload(content_type='text/plain')[0].status_code, 415)
+        self.assertEqual(self.upload(duration=voice.MAX_VOICE_SECONDS + 1)[0].status_code, 400)
+        self.assertEqual(self.upload(body=b'x' * (voice.MAX_VOICE_BYTES + 1))[0].status_code, 413)
+        self.assertFalse(ChatMessage.objects.exists())
+
+    def test_reading_stops_at_the_cap(self):
+        # A body without a usable Content-Length is cut off while streaming
+        name, rejected = voice.save_upload(BytesIO(b'x' * (voice.MAX_VOICE_BYTES + 1)), 'audio/webm')
+        self.assertIsNone(name)
+        self.assertEqual(rejected[1], 413)
+
+    def test_ranges_and_cache_headers(self):
+        url = self.upload()[0].data['voice_file']
+        client = APIClient()
+
+        full = client.get(url)
+        self.assertEqual(full.status_code, 200)
+        self.assertEqual(b''.join(full.streaming_content), self.audio)
+        self.assertEqual(full['Accept-Ranges'], 'bytes')
+        self.assertIn('max-age', full['Cache-Control'])
+
+        part = client.get(url, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(part.status_code, 206)
+        self.assertEqual(b''.join(part.streaming_content), self.audio[10:20])
+        self.assertEqual(part['Content-Range'], f'bytes 10-19/{len(self.audio)}')
+
+        tail = client.get(url, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(tail.streaming_content), self.audio[-5:])
+        self.assertEqual(client.get(url, HTTP_RANGE=f'bytes={len(self.audio)}-').status_code, 416)
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=full['ETag']).status_code, 304)
+        self.assertEqual(client.get(url.replace('/voice/', '/voice/x')).status_code, 404)
+
+    def test_block_revokes_the_url(self):
+        url = self.upload()[0].data['voice_file']
+        self.assertEqual(APIClient().get(url).status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            Block.objects.create(blocker=self.partner, blocked_user=self.user)
+        self.assertEqual(APIClient().get(url).status_code, 404)
+
+    def test_failed_save_removes_the_audio(self):
+        storage = ChatMessage._meta.get_field('voice_file').storage
+        with mock.patch('chat.views.MessageSerializer.save', side_effect=DatabaseError), self.assertRaises(DatabaseError):
+            self.upload()
+        self.assertEqual(storage.listdir('chat_voice')[1], [])
+
+    def test_oversized_upload_is_refused_before_the_body(self):
+        sent = []
+
+        async def app(scope, receive, send):
+            sent.append('app')
+
+        async def send(event):
+            sent.append(event)
+
+        async def receive():
+            raise AssertionError("The body must not be read")
+
+        scope = {'type': 'http', 'path': '/api/messages/voice/',
+                 'headers': [(b'content-length', str(voice.MAX_VOICE_BYTES + 1).encode())]}
+        async_to_sync(voice.UploadLimitMiddleware(app))(scope, receive, send)
+        self.assertEqual(sent[0]['status'], 413)
+        self.assertNotIn('app', sent)
@@ -0,0 +1,16 @@
+from django.core.cache import cache
+
+# A typing signal shows for this long unless it is repeated
+TYPING_TTL = 3
+# Minimum seconds between typing frames forwarded for one conversation
+TYPING_DEBOUNCE = 1
+
+def _key(sender_id, receiver_id):
+    return f"typing:{sender_id}:{receiver_id}"
+
+def mark_typing(sender_id, receiver_id):
+    cache.set(_key(sender_id, receiver_id), 1, TYPING_TTL)
+
+def is_typing(sender_id, receiver_id):
+    """Whether ``sender_id`` typed to ``receiver_id`` within the last TYPING_TTL seconds."""
+    return cache.get(_key(sender_id, receiver_id)) is not None
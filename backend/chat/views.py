@@ -1,32 +1,36 @@
 
 from rest_framework import viewsets, permissions, response, status, serializers, generics, views
-from .models import ChatMessage
+from .models import ChatMessage, Conversation
+from .serializers import MessageSerializer
+from .dispatch import send_on_commit
+from . import presence, typing, voice
+from dating_core import background
 from matches.models import Match
+from .messaging import permission_error, content_error, mark_read
 from reports.models import Block
-from django.db.models import Q
-from users.models import User
+from django.db.models import Q, F, Case, When, Subquery, OuterRef, Value, DateTimeField
+from django.db.models.functions import Coalesce
+from profiles.models import Profile, UserPhoto
+from profiles.photos import variant_name
+from django.db import transaction
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 import datetime
+from io import BytesIO
 
-# Simple in-memory typing status for MVP
-TYPING_STORE = {}
+# Re-sent window on inbox catch-up calls, see ChatListView
+SINCE_OVERLAP = datetime.timedelta(seconds=5)
 
-class MessageSerializer(serializers.ModelSerializer):
-    reply_to = serializers.SerializerMethodField()
+# Most users one presence lookup may ask about
+MAX_PRESENCE_IDS = 100
 
-    class Meta:
-        model = ChatMessage
-        fields = '__all__'
-        read_only_fields = ('sender', 'timestamp')
+# Messages returned per history page, and the most a client may ask for
+MESSAGE_PAGE_SIZE = 50
+MAX_MESSAGE_PAGE_SIZE = 100
 
-    def get_reply_to(self, obj):
-        if obj.parent_message:
-            return {
-                "id": obj.parent_message.id, 
-                "content": obj.parent_message.content,
-                "sender": obj.parent_message.sender.first_name
-            }
-        return None
+# Cursor timestamps used when no message is at or around the cursor id
+EARLIEST = Value(datetime.datetime.min.replace(tzinfo=datetime.timezone.utc), output_field=DateTimeField())
+LATEST = Value(datetime.datetime.max.replace(tzinfo=datetime.timezone.utc), output_field=DateTimeField())
 
 class ChatViewSet(viewsets.ModelViewSet):
     serializer_class = MessageSerializer
@@ -40,132 +44,228 @@ class ChatViewSet(viewsets.ModelViewSet):
         return ChatMessage.objects.filter(
             (Q(sender=self.request.user) & Q(receiver_id=other_user_id)) |
             (Q(sender_id=other_user_id) & Q(receiver=self.request.user))
-        ).order_by('timestamp')
+        ).select_related('parent_message__sender').order_by('timestamp')
 
     def list(self, request, *args, **kwargs):
+        """One page of the conversation, oldest first.
+
+        Without a cursor this is the latest page. ``before_id`` pages back
+        through history and ``after_id`` returns only messages newer than the
+        last one the client has. Pages are keyset filtered on
+        (timestamp, id), so their cost does not grow with the conversation.
+        The cursor's timestamp is read from the nearest surviving message, so
+        a deleted cursor message does not stall the client; with none on that
+        side the bound is dropped.
+        """
+        try:
+            before_id = int(request.query_params['before_id']) if 'before_id' in request.query_params else None
+            after_id = int(request.query_params['after_id']) if 'after_id' in request.query_params else None
+            limit = int(request.query_params.get('limit', MESSAGE_PAGE_SIZE))
+        except ValueError:
+            return response.Response({"error": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, MAX_MESSAGE_PAGE_SIZE))
+
         queryset = self.filter_queryset(self.get_queryset())
-        serializer = self.get_serializer(queryset, many=True)
-        
-        # Update My Activity
-        User.objects.filter(pk=request.user.pk).update(last_activity=timezone.now())
-
-        # Mark as read
-        if self.request.query_params.get('user_id'):
-            other_uid = self.request.query_params.get('user_id')
-            ChatMessage.objects.filter(
-                sender_id=other_uid, 
-                receiver=request.user, 
-                is_read=False
-            ).update(is_read=True)
+        if after_id is not None:
+            # Nothing at or before after_id (e.g. a sync from 0): every message is newer
+            cursor = Coalesce(Subquery(ChatMessage.objects.filter(pk__lte=after_id).order_by('-pk').values('timestamp')[:1]), EARLIEST)
+            queryset = queryset.filter(Q(timestamp__gt=cursor) | Q(timestamp=cursor, id__gt=after_id))\
+                .order_by('timestamp', 'id')
+        else:
+            if before_id is not None:
+                # Nothing at or past before_id: every message is older, so this is the latest page
+                cursor = Coalesce(Subquery(ChatMessage.objects.filter(pk__gte=before_id).order_by('pk').values('timestamp')[:1]), LATEST)
+                queryset = queryset.filter(Q(timestamp__lt=cursor) | Q(timestamp=cursor, id__lt=before_id))
+            queryset = queryset.order_by('-timestamp', '-id')
+
+        page = list(queryset[:limit + 1])
+        has_more = len(page) > limit
+        page = page[:limit]
+        if after_id is None:
+            page.reverse()
+
+        # Reading the latest messages moves the read cursor up to them; older
+        # pages and repeat fetches leave it where it is and write nothing
+        conversation = None
+        other_uid = self.request.query_params.get('user_id')
+        if other_uid and int(other_uid) != request.user.id:
+            newest = max((m.id for m in page if m.receiver_id == request.user.id), default=0)
+            conversation = mark_read(request.user, other_uid, newest) \
+                or Conversation.objects.between(request.user.id, other_uid).first()
+
+        serializer = self.get_serializer(page, many=True, context={**self.get_serializer_context(), 'conversation': conversation})
 
         # Metadata about partner
         other_user_id = request.query_params.get('user_id')
         partner_data = {}
         if other_user_id:
-            try:
-                other_user = User.objects.get(pk=other_user_id)
-                # Online if active in last 2 mins
-                is_online = False
-                if other_user.last_activity:
-                    diff = timezone.now() - other_user.last_activity
-                    is_online = diff.total_seconds() < 120
-                
-                # Check typing
-                is_typing = False
-                typing_key = f"{other_user_id}:{request.user.id}"
-                last_typed = TYPING_STORE.get(typing_key)
-                if last_typed:
-                    if (datetime.datetime.now() - last_typed).total_seconds() < 3:
-                        is_typing = True
-
-                partner_data = {
-                    "is_online": is_online,
-                    "last_seen": other_user.last_activity,
-                    "is_typing": is_typing
-                }
-            except User.DoesNotExist:
-                pass
+            # Online while they have a chat socket open (see chat.presence)
+            partner_data = presence.lookup([int(other_user_id)])[int(other_user_id)]
+
+            # Check typing
+            partner_data["is_typing"] = typing.is_typing(other_user_id, request.user.id)
 
         return response.Response({
             "messages": serializer.data,
+            "has_more": has_more,
             "partner_status": partner_data
         })
 
     def create(self, request, *args, **kwargs):
         receiver_id = request.data.get('receiver')
-        
-        # Check for block
-        is_blocked = Block.objects.filter(
-            Q(blocker=request.user, blocked_user_id=receiver_id) |
-            Q(blocker_id=receiver_id, blocked_user=request.user)
-        ).exists()
-        
-        if is_blocked:
-             return response.Response({"error": "You cannot message this user."}, status=status.HTTP_403_FORBIDDEN)
 
-        # Check if matched before allowing chat
-        is_matched = Match.objects.filter(users=request.user).filter(users__id=receiver_id).exists()
-        if not is_matched:
-            return response.Response({"error": "You must match before chatting"}, status=status.HTTP_403_FORBIDDEN)
-        
-        content = request.data.get('content', '')
-        if "http" in content or "@" in content:
-            return response.Response({"error": "External links and emails are not allowed for safety."}, status=status.HTTP_400_BAD_REQUEST)
+        error = permission_error(request.user, receiver_id)
+        if error:
+            return response.Response({"error": error}, status=status.HTTP_403_FORBIDDEN)
+
+        error = content_error(request.data.get('content') or '')
+        if error:
+            return response.Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
 
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        serializer.save(sender=request.user)
+        serializer.save(sender=request.user, receiver_id=int(receiver_id))
         return response.Response(serializer.data, status=status.HTTP_201_CREATED)
 
+class VoiceUploadView(views.APIView):
+    """Send a voice message: the raw audio is the request body.
+
+    ``POST /api/messages/voice/?receiver=<id>&duration=<seconds>`` with an
+    audio Content-Type. The body is copied to storage in chunks instead of
+    going through multipart parsing, and re-encoded on the background pool.
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def post(self, request):
+        receiver_id = request.query_params.get('receiver')
+
+        error = permission_error(request.user, receiver_id)
+        if error:
+            return response.Response({"error": error}, status=status.HTTP_403_FORBIDDEN)
+
+        rejected = voice.upload_error(
+            request.content_type, request.META.get('CONTENT_LENGTH'), request.query_params.get('duration')
+        )
+        if rejected:
+            return response.Response({"error": rejected[0]}, status=rejected[1])
+
+        serializer = MessageSerializer(data={
+            'message_type': 'voice',
+            'parent_message': request.query_params.get('parent_message'),
+        }, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+
+        name, rejected = voice.save_upload(request.stream or BytesIO(), request.content_type)
+        if rejected:
+            return response.Response({"error": rejected[0]}, status=rejected[1])
+
+        try:
+            message = serializer.save(sender=request.user, receiver_id=int(receiver_id), voice_file=name)
+        except Exception:
+            # Nothing references the stored audio
+            voice.delete_upload(name)
+            raise
+        background.submit(voice.normalize, message.id)
+        return response.Response(serializer.data, status=status.HTTP_201_CREATED)
+
+class VoiceFileView(views.APIView):
+    """Audio of a voice message, with range and conditional requests for players.
+
+    The signed URL from the message payload is the credential, as audio
+    elements cannot send the API token. It stops working once the pair is
+    unmatched, blocked or banned.
+    """
+    authentication_classes = ()
+    permission_classes = (permissions.AllowAny,)
+
+    def get(self, request, token):
+        return voice.file_response(request, token)
+
 class TypingView(views.APIView):
     permission_classes = (permissions.IsAuthenticated,)
 
     def post(self, request):
         receiver_id = request.data.get('receiver_id')
         if receiver_id:
-            key = f"{request.user.id}:{receiver_id}"
-            TYPING_STORE[key] = datetime.datetime.now()
+            typing.mark_typing(request.user.id, receiver_id)
         return response.Response({"status": "ok"})
 
+class PresenceView(views.APIView):
+    """Online status and last seen for several matches at once, for the inbox."""
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get(self, request):
+        try:
+            requested = {int(i) for i in request.query_params.get('user_ids', '').split(',') if i}
+        except ValueError:
+            return response.Response({"error": "Invalid user_ids."}, status=status.HTTP_400_BAD_REQUEST)
+        if len(requested) > MAX_PRESENCE_IDS:
+            return response.Response({"error": f"At most {MAX_PRESENCE_IDS} users per call."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Only matches' presence is visible
+        visible = set(Match.objects.partner_ids(request.user).filter(partner_id__in=requested)) if requested else set()
+        return response.Response({
+            str(user_id): status_ for user_id, status_ in presence.lookup(visible).items()
+        })
+
 class ChatListView(generics.ListAPIView):
     permission_classes = (permissions.IsAuthenticated,)
     
     def get(self, request):
+        """The inbox, most recent conversation first.
+
+        With ``?since=<server_time>`` only conversations changed after that
+        time are returned, wrapped with a new ``server_time``, so a client
+        can catch up after a reconnect instead of polling.
+        """
         user = request.user
-        messages = ChatMessage.objects.filter(Q(sender=user) | Q(receiver=user)).order_by('-timestamp')
-        
-        participants = set()
-        for m in messages:
-            participants.add(m.sender_id if m.sender_id != user.id else m.receiver_id)
-        
-        blocked_ids = set(Block.objects.filter(blocker=user).values_list('blocked_user_id', flat=True))
-        blocked_by_ids = set(Block.objects.filter(blocked_user=user).values_list('blocker_id', flat=True))
-            
+        since = None
+        if 'since' in request.query_params:
+            since = parse_datetime(request.query_params['since'])
+            if since is None:
+                return response.Response({"error": "Invalid since."}, status=status.HTTP_400_BAD_REQUEST)
+        server_time = timezone.now()
+
+        is_low = Q(user_low=user)
+        partner = Case(When(is_low, then=F('user_high_id')), default=F('user_low_id'))
+
+        # Conversations are maintained on message write, so the inbox is a plain read
+        conversations = Conversation.objects.for_user(user)\
+            .filter(last_message_at__isnull=False)
+        if since is not None:
+            # Overlap a little so rows committed while the last call ran are not missed
+            conversations = conversations.filter(updated_at__gt=since - SINCE_OVERLAP)
+        conversations = conversations\
+            .annotate(partner_id=partner)\
+            .exclude(partner_id__in=Block.objects.filter(blocker=user).values('blocked_user_id'))\
+            .exclude(partner_id__in=Block.objects.filter(blocked_user=user).values('blocker_id'))\
+            .annotate(
+                unread_count=Case(When(is_low, then=F('low_unread_count')), default=F('high_unread_count')),
+                name=Subquery(Profile.objects.filter(user_id=OuterRef('partner_id')).values('first_name')[:1]),
+                photo=Subquery(
+                    UserPhoto.objects.filter(user_id=OuterRef('partner_id'))
+                        .exclude(image='')
+                        .order_by('-is_primary', 'id')
+                        .values(src=variant_name('thumb'))[:1]
+                ),
+            )\
+            .order_by('-last_message_at')\
+            .values('partner_id', 'name', 'photo', 'last_message_preview', 'last_message_at', 'unread_count')
+
+        storage = UserPhoto._meta.get_field('image').storage
         results = []
-        for p_id in participants:
-            if p_id in blocked_ids or p_id in blocked_by_ids: continue
-
-            try:
-                other_user = User.objects.get(id=p_id)
-                profile = getattr(other_user, 'profile', None)
-                photo = other_user.photos.filter(is_primary=True).first() or other_user.photos.first()
-                last_msg = messages.filter(Q(sender_id=p_id) | Q(receiver_id=p_id)).first()
-                unread_count = ChatMessage.objects.filter(sender_id=p_id, receiver=user, is_read=False).count()
-                
-                results.append({
-                    "user_id": other_user.id,
-                    "name": profile.first_name if profile else "User",
-                    "photo": photo.image.url if photo and photo.image else None,
-                    "last_msg": last_msg.content if last_msg and last_msg.message_type == 'text' else "Voice message",
-                    "time": last_msg.timestamp if last_msg else None,
-                    "unread_count": unread_count
-                })
-            except User.DoesNotExist:
-                continue
-        
-        # Sort by time descend
-        results.sort(key=lambda x: x['time'] if x['time'] else datetime.datetime.min.replace(tzinfo=datetime.timezone.utc), reverse=True)
-            
+        for c in conversations:
+            results.append({
+                "user_id": c['partner_id'],
+                "name": c['name'] if c['name'] is not None else "User",
+                "photo": storage.url(c['photo']) if c['photo'] else None,
+                "last_msg": c['last_message_preview'],
+                "time": c['last_message_at'],
+                "unread_count": c['unread_count']
+            })
+
+        if since is not None:
+            return response.Response({"results": results, "server_time": server_time})
         return response.Response(results)
 
 from .models import Call
@@ -177,6 +277,15 @@ class CallSerializer(serializers.ModelSerializer):
         model = Call
         fields = '__all__'
 
+def call_events(call):
+    """Signaling events for both sides of a call, keyed like the poll response."""
+    data = dict(CallSerializer(call).data)
+    receiver_kind = 'incoming' if call.status == 'initiated' else 'incoming_update'
+    return [
+        (f"user_{call.caller_id}", {'type': 'call_update', 'kind': 'my_call', 'call': data}),
+        (f"user_{call.receiver_id}", {'type': 'call_update', 'kind': receiver_kind, 'call': data}),
+    ]
+
 class CallViewSet(viewsets.ModelViewSet):
     queryset = Call.objects.all()
     serializer_class = CallSerializer
@@ -186,25 +295,38 @@ class CallViewSet(viewsets.ModelViewSet):
     def start(self, request):
         receiver_id = request.data.get('receiver')
         sdp_offer = request.data.get('sdp_offer')
+
+        error = permission_error(request.user, receiver_id)
+        if error:
+            return response.Response({"error": error}, status=status.HTTP_403_FORBIDDEN)
         
-        # Close pending calls
-        Call.objects.filter(caller=request.user, status='initiated').update(status='ended')
-        
-        call = Call.objects.create(
-            caller=request.user,
-            receiver_id=receiver_id,
-            sdp_offer=sdp_offer,
-            status='initiated'
-        )
-        
-        # Create Chat History Item
-        ChatMessage.objects.create(
-            sender=request.user,
-            receiver_id=receiver_id,
-            message_type='call',
-            content='Call started'
-        )
-        
+        with transaction.atomic():
+            # Close pending calls
+            pending = list(Call.objects.filter(caller=request.user, status='initiated'))
+            Call.objects.filter(pk__in=[c.pk for c in pending]).update(status='ended')
+            events = []
+            for stale in pending:
+                stale.status = 'ended'
+                events.extend(call_events(stale))
+
+            call = Call.objects.create(
+                caller=request.user,
+                receiver_id=receiver_id,
+                sdp_offer=sdp_offer,
+                status='initiated'
+            )
+
+            # Create Chat History Item
+            ChatMessage.objects.create(
+                sender=request.user,
+                receiver_id=receiver_id,
+                message_type='call',
+                content='Call started'
+            )
+
+            # Ring the receiver as soon as this commits
+            send_on_commit(events + call_events(call))
+
         return response.Response(CallSerializer(call).data)
 
     @action(detail=True, methods=['post'])
@@ -217,7 +339,9 @@ class CallViewSet(viewsets.ModelViewSet):
             
         call.sdp_answer = sdp_answer
         call.status = 'active'
-        call.save()
+        with transaction.atomic():
+            call.save()
+            send_on_commit(call_events(call))
         return response.Response(CallSerializer(call).data)
         
     @action(detail=True, methods=['post'])
@@ -226,11 +350,14 @@ class CallViewSet(viewsets.ModelViewSet):
         if call.receiver != request.user and call.caller != request.user:
              return response.Response({"error": "Not your call"}, status=403)
         call.status = 'ended'
-        call.save()
+        with transaction.atomic():
+            call.save()
+            send_on_commit(call_events(call))
         return response.Response({"status": "ended"})
 
     @action(detail=False, methods=['get'])
     def poll(self, request):
+        # Fallback for clients without a chat socket, which get call_update pushes instead
         # Check incoming calls (invited)
         incoming = Call.objects.filter(
             receiver=request.user, 
@@ -0,0 +1,211 @@
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import uuid
+from django.core import signing
+from django.core.files import File
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.http import parse_header_parameters
+from matches.relationships import relationship
+from .models import ChatMessage
+
+logger = logging.getLogger(__name__)
+
+MAX_VOICE_SECONDS = 120
+# MAX_VOICE_SECONDS at 128 kbps, the highest default bitrate of browser recorders
+MAX_VOICE_BYTES = 2 * 1024 * 1024
+# Bytes read from the request or a stored file at a time
+CHUNK_SIZE = 64 * 1024
+
+# Accepted upload types and the extension they are stored under
+VOICE_TYPES = {
+    'audio/webm': 'webm',
+    'audio/ogg': 'ogg',
+    'audio/mp4': 'm4a',
+    'audio/mpeg': 'mp3',
+    'audio/wav': 'wav',
+}
+
+# Uploads are re-encoded to mono Opus in the background so every client can play them
+TRANSCODE_ARGS = ['-vn', '-ac', '1', '-ar', '48000', '-c:a', 'libopus', '-b:a', '32k']
+TRANSCODE_TIMEOUT = 60
+
+# Voice URLs are signed and stable, so clients may cache the audio
+VOICE_CACHE_SECONDS = 24 * 60 * 60
+
+_signer = signing.Signer(salt='chat.voice')
+
+TOO_LARGE_ERROR = "Voice messages are limited to %d KB." % (MAX_VOICE_BYTES // 1024)
+
+def voice_url(message):
+    """Stable URL of a message's audio.
+
+    The signature grants access only while the pair is matched and neither
+    side is blocked or banned; ``file_response`` checks that on each request.
+    """
+    return reverse('chat_voice', args=[_signer.sign(str(message.id))])
+
+def media_type(content_type):
+    """The bare, lowercased media type of a Content-Type, e.g. ``audio/webm`` for ``audio/webm;codecs=opus``."""
+    return parse_header_parameters(content_type or '')[0].lower()
+
+def upload_error(content_type, content_length, duration):
+    """Return ``(error, status)`` for an upload that can be rejected before reading it, or None."""
+    if media_type(content_type) not in VOICE_TYPES:
+        return "Unsupported audio format.", 415
+    if str(content_length or '').isdigit() and int(content_length) > MAX_VOICE_BYTES:
+        return TOO_LARGE_ERROR, 413
+    try:
+        seconds = float(duration)
+    except (TypeError, ValueError):
+        return "Missing or invalid duration.", 400
+    if not 0 < seconds <= MAX_VOICE_SECONDS:
+        return "Voice messages are limited to %d seconds." % MAX_VOICE_SECONDS, 400
+    return None
+
+def save_upload(stream, content_type):
+    """Copy a raw request body to storage, CHUNK_SIZE bytes at a time.
+
+    Reading stops as soon as the body passes MAX_VOICE_BYTES, so a client
+    without a truthful Content-Length cannot push more. Returns ``(name,
+    None)``, or ``(None, (error, status))`` like ``upload_error``.
+    """
+    field = ChatMessage._meta.get_field('voice_file')
+    with tempfile.TemporaryFile() as tmp:
+        size = 0
+        while chunk := stream.read(CHUNK_SIZE):
+            size += len(chunk)
+            if size > MAX_VOICE_BYTES:
+                return None, (TOO_LARGE_ERROR, 413)
+            tmp.write(chunk)
+        if not size:
+            return None, ("Empty upload.", 400)
+        tmp.seek(0)
+        name = field.storage.save(f"{field.upload_to}{uuid.uuid4().hex}.{VOICE_TYPES[media_type(content_type)]}", File(tmp))
+    return name, None
+
+def delete_upload(name):
+    """Remove audio stored by ``save_upload`` that no message ended up using."""
+    ChatMessage._meta.get_field('voice_file').storage.delete(name)
+
+def normalize(message_id):
+    """Re-encode a message's audio with ffmpeg and swap it in.
+
+    Runs on the background pool. The file is replaced with a queryset
+    update, so the message is not re-sent to the sockets; its URL does not
+    change. A no-op where ffmpeg is not installed.
+    """
+    ffmpeg = shutil.which('ffmpeg')
+    message = ChatMessage.objects.filter(pk=message_id).only('voice_file').first()
+    if ffmpeg is None or message is None or not message.voice_file:
+        return
+    storage = message.voice_file.storage
+    old_name = message.voice_file.name
+
+    with tempfile.TemporaryDirectory() as workdir:
+        source = os.path.join(workdir, 'source')
+        target = os.path.join(workdir, 'voice.ogg')
+        with storage.open(old_name) as stored, open(source, 'wb') as copy:
+            shutil.copyfileobj(stored, copy, CHUNK_SIZE)
+        result = subprocess.run(
+            [ffmpeg, '-nostdin', '-y', '-i', source, *TRANSCODE_ARGS, target],
+            capture_output=True, timeout=TRANSCODE_TIMEOUT
+        )
+        if result.returncode != 0:
+            logger.warning("Could not transcode voice message %s: %s", message_id, result.stderr[-500:])
+            return
+        with open(target, 'rb') as encoded:
+            new_name = storage.save(f"{os.path.dirname(old_name)}/{uuid.uuid4().hex}.ogg", File(encoded))
+
+    if ChatMessage.objects.filter(pk=message_id, voice_file=old_name).update(voice_file=new_name):
+        storage.delete(old_name)
+    else:
+        # Deleted or replaced meanwhile
+        storage.delete(new_name)
+
+_range_re = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+def file_response(request, token):
+    """Serve the audio behind a signed voice URL, honouring Range and If-None-Match."""
+    try:
+        message_id = int(_signer.unsign(token))
+    except (signing.BadSignature, ValueError):
+        return HttpResponse(status=404)
+    message = ChatMessage.objects.filter(pk=message_id).only('sender_id', 'receiver_id', 'voice_file').first()
+    if message is None or not message.voice_file:
+        return HttpResponse(status=404)
+    # A block, ban or unmatch revokes URLs handed out earlier
+    state = relationship(message.sender_id, message.receiver_id)
+    if state is None or state['blocked'] or not state['matched']:
+        return HttpResponse(status=404)
+
+    field_file = message.voice_file
+    size = field_file.size
+    etag = '"%s"' % uuid.uuid5(uuid.NAMESPACE_URL, f"{field_file.name}:{size}").hex
+    headers = {
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': f'private, max-age={VOICE_CACHE_SECONDS}',
+        'ETag': etag,
+    }
+    if request.headers.get('If-None-Match') == etag:
+        return HttpResponse(status=304, headers=headers)
+
+    start, end, status = 0, size - 1, 200
+    match = _range_re.match(request.headers.get('Range', ''))
+    if match and any(match.groups()):
+        first, last = match.groups()
+        if first:
+            start, end = int(first), min(int(last), size - 1) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(size - int(last), 0)
+        if start > end:
+            return HttpResponse(status=416, headers={**headers, 'Content-Range': f'bytes */{size}'})
+        status = 206
+        headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+
+    ext = os.path.splitext(field_file.name)[1].lstrip('.')
+    content_type = next((t for t, e in VOICE_TYPES.items() if e == ext), 'application/octet-stream')
+    response = StreamingHttpResponse(
+        _read_range(field_file, start, end - start + 1), status=status, content_type=content_type, headers=headers
+    )
+    response['Content-Length'] = str(end - start + 1)
+    return response
+
+def _read_range(field_file, start, length):
+    with field_file.storage.open(field_file.name) as stored:
+        stored.seek(start)
+        while length > 0:
+            chunk = stored.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+class UploadLimitMiddleware:
+    """ASGI middleware answering 413 to oversized voice uploads up front.
+
+    Django's ASGI handler reads a whole request body before the view runs;
+    this rejects a clip whose Content-Length is over the cap without
+    receiving it.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['path'] == reverse('chat_voice_upload'):
+            length = dict(scope['headers']).get(b'content-length', b'')
+            if length.isdigit() and int(length) > MAX_VOICE_BYTES:
+                body = json.dumps({"error": TOO_LARGE_ERROR}).encode()
+                await send({'type': 'http.response.start', 'status': 413, 'headers': [
+                    (b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()),
+                ]})
+                await send({'type': 'http.response.body', 'body': body})
+                return
+        await self.app(scope, receive, send)
@@ -11,9 +11,10 @@ from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 from django.urls import path
 from chat.consumers import ChatConsumer
+from chat.voice import UploadLimitMiddleware
 
 application = ProtocolTypeRouter({
-    "http": django_asgi_app,
+    "http": UploadLimitMiddleware(django_asgi_app),
     "websocket": AuthMiddlewareStack(
         URLRouter([
             path("ws/chat/", ChatConsumer.as_asgi()),
@@ -0,0 +1,37 @@
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# Threads per process for slow work kept off the request path (media processing)
+BACKGROUND_WORKERS = getattr(settings, 'BACKGROUND_WORKERS', 2)
+
+_executor = None
+_lock = threading.Lock()
+
+def _pool():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=BACKGROUND_WORKERS, thread_name_prefix='background')
+        return _executor
+
+def submit(task, *args):
+    """Run ``task(*args)`` on the background pool once the current transaction commits.
+
+    Tasks get their own database connection and must load what they need by
+    id. Failures are logged, never raised to the request.
+    """
+    transaction.on_commit(lambda: _pool().submit(_run, task, args))
+
+def _run(task, args):
+    close_old_connections()
+    try:
+        task(*args)
+    except Exception:
+        logger.exception("Background task %s failed", task.__name__)
+    finally:
+        close_old_connections()
@@ -77,8 +77,15 @@ CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer' if os.environ.get('REDIS_URL') else 'channels.layers.InMemoryChannelLayer',
         'CONFIG': {
-            'hosts': [os.environ.get('REDIS_URL')] if os.environ.get('REDIS_URL') else [],
-        },
+            'hosts': [os.environ.get('REDIS_URL')],
+        } if os.environ.get('REDIS_URL') else {},
+    },
+}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache' if os.environ.get('REDIS_URL') else 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': os.environ.get('REDIS_URL', ''),
     },
 }
 
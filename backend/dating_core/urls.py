@@ -15,8 +15,8 @@ from users.views import (
 )
 from profiles.views import ProfileDetailView, PublicProfileDetailView, InterestListView, UserPhotoViewSet
 from django.views.generic import TemplateView
-from matches.views import DiscoveryView, SwipeView, MatchListView
-from chat.views import ChatViewSet, ChatListView, TypingView, CallViewSet
+from matches.views import DiscoveryView, DiscoveryDeckView, SwipeView, SwipeBatchView, MatchListView
+from chat.views import ChatViewSet, ChatListView, TypingView, CallViewSet, PresenceView, VoiceUploadView, VoiceFileView
 from payments.views import SubscriptionPlanListView, PaymentRequestCreateView, MyPaymentStatusView
 from reports.views import ReportCreateView, BlockCreateView
 from rest_framework.routers import DefaultRouter
@@ -54,7 +54,9 @@ urlpatterns = [
     
     # Discovery & Swiping
     path('api/discovery/', DiscoveryView.as_view(), name='discovery'),
+    path('api/discovery/deck/', DiscoveryDeckView.as_view(), name='discovery_deck'),
     path('api/swipe/', SwipeView.as_view(), name='swipe'),
+    path('api/swipe/batch/', SwipeBatchView.as_view(), name='swipe_batch'),
     path('api/matches/', MatchListView.as_view(), name='match_list'),
     
     # Payments
@@ -69,6 +71,9 @@ urlpatterns = [
     # Router based (Photos, Chat)
     path('api/chats/', ChatListView.as_view(), name='chat_list'),
     path('api/chat/typing/', TypingView.as_view(), name='chat_typing'),
+    path('api/presence/', PresenceView.as_view(), name='presence'),
+    path('api/messages/voice/', VoiceUploadView.as_view(), name='chat_voice_upload'),
+    path('api/voice/<str:token>/', VoiceFileView.as_view(), name='chat_voice'),
     path('api/', include(router.urls)),
     
     # SEO Files
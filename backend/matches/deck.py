@@ -0,0 +1,99 @@
+import secrets
+from django.core import signing
+from django.core.cache import cache
+from django.db import connection
+from reports.models import Block
+from .models import DiscoveryIndex
+from .discovery import candidate_pool, rank_candidates, rank_in_database, build_cards
+
+# Ranked candidates dealt per deck, and cards handed out per page
+DECK_SIZE = 300
+PAGE_SIZE = 10
+# Decks older than this are dropped and the next call deals a fresh one
+DECK_TTL = 30 * 60
+
+_SALT = 'matches.deck'
+
+def _deck_key(token):
+    return f"discovery_deck:{token}"
+
+def _user_key(user_id):
+    return f"discovery_deck_user:{user_id}"
+
+def deal_deck(user, profile):
+    """Rank up to DECK_SIZE candidates once and cache them. Returns a cursor."""
+    if connection.vendor == 'postgresql':
+        ranked = rank_in_database(user, profile, k=DECK_SIZE)
+    else:
+        ranked = rank_candidates(profile, candidate_pool(user, profile), k=DECK_SIZE)
+
+    token = secrets.token_urlsafe(12)
+    cache.set(_deck_key(token), {'user_id': user.id, 'entries': ranked, 'consumed': []}, DECK_TTL)
+    # A user only ever pages through their latest deck
+    cache.set(_user_key(user.id), token, DECK_TTL)
+    return make_cursor(token, 0)
+
+def make_cursor(token, offset):
+    return signing.dumps({'d': token, 'o': offset}, salt=_SALT)
+
+def read_cursor(cursor):
+    """Return ``(token, offset)`` or None if the cursor is invalid."""
+    try:
+        data = signing.loads(cursor, salt=_SALT)
+        return data['d'], int(data['o'])
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        return None
+
+def next_page(user, cursor, size=PAGE_SIZE):
+    """Return ``(cards, next_cursor)`` for a deck cursor.
+
+    Returns None if the deck expired or belongs to someone else. Entries that
+    were swiped, blocked or deactivated since the deal are skipped, and
+    next_cursor is None once the deck is exhausted.
+    """
+    parsed = read_cursor(cursor)
+    if parsed is None:
+        return None
+    token, offset = parsed
+    deck = cache.get(_deck_key(token))
+    if deck is None or deck['user_id'] != user.id:
+        return None
+
+    entries = deck['entries']
+    consumed = set(deck['consumed'])
+    page = []
+    while offset < len(entries) and len(page) < size:
+        window = [e for e in entries[offset:offset + size] if e[0] not in consumed]
+        offset += size
+
+        ids = [user_id for user_id, _ in window]
+        valid = set(DiscoveryIndex.objects.filter(user_id__in=ids, is_active=True)
+            .exclude(user_id__in=Block.objects.filter(blocker=user).values('blocked_user_id'))
+            .exclude(user_id__in=Block.objects.filter(blocked_user=user).values('blocker_id'))
+            .values_list('user_id', flat=True))
+        page.extend(e for e in window if e[0] in valid)
+
+    # Anything beyond the requested size goes back on the deck
+    if len(page) > size:
+        offset = entries.index(page[size])
+        page = page[:size]
+
+    next_cursor = make_cursor(token, offset) if offset < len(entries) else None
+    return build_cards(page), next_cursor
+
+def consume_deck_entry(user_id, target_id):
+    """Mark a swiped candidate as consumed in the user's live deck."""
+    consume_deck_entries(user_id, [target_id])
+
+def consume_deck_entries(user_id, target_ids):
+    token = cache.get(_user_key(user_id))
+    if token is None:
+        return
+    deck = cache.get(_deck_key(token))
+    if deck is None:
+        return
+    fresh = [t for t in target_ids if t not in deck['consumed']]
+    if not fresh:
+        return
+    deck['consumed'].extend(fresh)
+    cache.set(_deck_key(token), deck, DECK_TTL)
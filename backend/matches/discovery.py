@@ -0,0 +1,142 @@
+import heapq
+from django.db.models import Case, When, Value, IntegerField, F, OuterRef, Subquery, Count, Exists
+from django.db.models.functions import Coalesce
+from profiles.models import Profile
+from profiles.photos import photo_url
+from reports.models import Block
+from users.models import User
+from .models import DiscoveryIndex, Swipe, Match
+from .scoring import (
+    intent_mask, interest_mask, decode_mask, score_batch,
+    INTENT_POINTS, INTEREST_POINTS, DISTRICT_POINTS,
+)
+
+# Upper bound on how many index rows a single discovery call will score
+POOL_SIZE = 500
+# Number of cards returned per discovery call
+TOP_K = 10
+# Candidates are scored this many at a time
+CHUNK_SIZE = 200
+
+def candidate_queryset(user, profile):
+    """Active index rows in the viewer's gender bucket that the viewer has not
+    swiped on, matched with, blocked, or been blocked by.
+
+    Exclusions are NOT EXISTS anti-joins, so heavy swipers do not turn into
+    huge ``IN (...)`` parameter lists.
+    """
+    swiped = Swipe.objects.filter(swiper=user, target_id=OuterRef('user_id'))
+    blocked = Block.objects.filter(blocker=user, blocked_user_id=OuterRef('user_id'))
+    blocked_by = Block.objects.filter(blocked_user=user, blocker_id=OuterRef('user_id'))
+
+    pool = DiscoveryIndex.objects.filter(is_active=True)\
+        .exclude(user_id=user.id)\
+        .filter(~Exists(swiped), ~Exists(blocked), ~Exists(blocked_by))\
+        .exclude(user_id__in=Match.objects.partner_ids(user))
+
+    # Filter by gender interest
+    if profile.interested_in in ('male', 'female'):
+        pool = pool.filter(gender=profile.interested_in)
+    return pool
+
+def candidate_pool(user, profile):
+    """Return up to POOL_SIZE ``(user_id, district, intent_mask, interest_mask)``
+    rows from the discovery index.
+
+    Rows in the viewer's district come first (they carry the district bonus),
+    then the most recently updated profiles.
+    """
+    pool = candidate_queryset(user, profile).annotate(
+        same_district=Case(
+            When(district=profile.district, then=Value(0)),
+            default=Value(1),
+            output_field=IntegerField(),
+        )
+    ).order_by('same_district', '-updated_at')
+
+    return list(pool.values_list('user_id', 'district', 'intent_mask', 'interest_mask')[:POOL_SIZE])
+
+def rank_candidates(profile, pool, k=TOP_K):
+    """Score pool rows in chunks and return ``[(user_id, score)]`` for the best k.
+
+    Scores come from the bitmasks cached on the index, so no profile or
+    interest rows are loaded; a bounded heap keeps the top k so nothing is
+    serialized for candidates that do not make the cut. Ties go to the lower
+    user id.
+    """
+    my_intents = intent_mask(profile.relationship_intents)
+    my_interests = interest_mask(profile.interests.values_list('id', flat=True))
+
+    heap = []
+    for start in range(0, len(pool), CHUNK_SIZE):
+        chunk = pool[start:start + CHUNK_SIZE]
+        scores = score_batch(my_intents, my_interests, profile.district, [
+            (c_intents, decode_mask(c_interests), district)
+            for _, district, c_intents, c_interests in chunk
+        ])
+        for (user_id, *_), score in zip(chunk, scores):
+            entry = (score, -user_id)
+            if len(heap) < k:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+
+    return [(-neg_id, score) for score, neg_id in sorted(heap, reverse=True)]
+
+def build_cards(ranked):
+    """Build the response payload for already ranked ``(user_id, score)`` pairs."""
+    users = User.objects.filter(id__in=[user_id for user_id, _ in ranked])\
+        .select_related('profile')\
+        .prefetch_related('photos')
+    by_id = {u.id: u for u in users}
+
+    cards = []
+    for user_id, score in ranked:
+        c = by_id.get(user_id)
+        if c is None: continue
+        c_profile = c.profile
+        cards.append({
+            "user_id": c.id,
+            "first_name": c_profile.first_name,
+            "age": c_profile.age,
+            "district": c_profile.district,
+            "bio": c_profile.bio,
+            "photos": [photo_url(p, 'card') for p in c.photos.all()],
+            "score": score
+        })
+    return cards
+
+def rank_in_database(user, profile, k=TOP_K):
+    """Rank the viewer's whole bucket in the database.
+
+    Applies the same rules and tie-break as ``rank_candidates`` as annotated
+    expressions, ordered and limited in SQL so only k rows cross the wire.
+    Used on PostgreSQL.
+    """
+    my_interests = list(profile.interests.values_list('id', flat=True))
+
+    if my_interests:
+        shared = Profile.interests.through.objects.filter(
+            profile__user_id=OuterRef('user_id'), interest_id__in=my_interests
+        ).order_by().values('profile_id').annotate(n=Count('*')).values('n')
+        shared_interests = Coalesce(Subquery(shared, output_field=IntegerField()), Value(0))
+    else:
+        shared_interests = Value(0)
+
+    intent_points = Case(
+        When(intent_overlap=0, then=Value(0)),
+        default=Value(INTENT_POINTS),
+        output_field=IntegerField(),
+    )
+    district_points = Case(
+        When(district=profile.district, then=Value(DISTRICT_POINTS)),
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+
+    rows = candidate_queryset(user, profile)\
+        .annotate(intent_overlap=F('intent_mask').bitand(intent_mask(profile.relationship_intents)))\
+        .annotate(score=intent_points + shared_interests * INTEREST_POINTS + district_points)\
+        .order_by('-score', 'user_id')\
+        .values_list('user_id', 'score')[:k]
+    return list(rows)
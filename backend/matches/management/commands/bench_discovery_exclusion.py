@@ -0,0 +1,68 @@
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction, DatabaseError
+from users.models import User
+from profiles.models import Profile
+from reports.models import Block
+from matches.models import Swipe, DiscoveryIndex
+from matches.discovery import candidate_queryset
+
+class Command(BaseCommand):
+    help = 'Compares id__in and NOT EXISTS discovery exclusion for a heavy swiper (data is rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--swipes', type=int, default=50000)
+        parser.add_argument('--fresh', type=int, default=2000, help='Unswiped candidates')
+        parser.add_argument('--rounds', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            viewer = self.seed(options['swipes'], options['fresh'])
+            self.compare(viewer, options['rounds'])
+            transaction.set_rollback(True)
+
+    def seed(self, swipes, fresh):
+        self.stdout.write(f'Seeding {swipes} swipes and {fresh} fresh candidates...')
+        viewer = User.objects.create_user(email='bench-viewer@example.com')
+
+        User.objects.bulk_create([
+            User(email=f'bench-{i}@example.com', password='!') for i in range(swipes + fresh)
+        ], batch_size=5000)
+        ids = list(User.objects.filter(email__startswith='bench-').exclude(pk=viewer.pk).values_list('id', flat=True))
+
+        DiscoveryIndex.objects.bulk_create([
+            DiscoveryIndex(user_id=i, gender='female', district='ernakulam') for i in ids
+        ], batch_size=5000)
+        Swipe.objects.bulk_create([
+            Swipe(swiper=viewer, target_id=i, action='dislike') for i in ids[:swipes]
+        ], batch_size=5000)
+        return viewer
+
+    def compare(self, viewer, rounds):
+        profile = Profile.objects.get(user=viewer)
+
+        def old_query():
+            # What discovery did before: materialize the ids, then exclude(id__in=...)
+            swiped_ids = set(Swipe.objects.filter(swiper=viewer).values_list('target_id', flat=True))
+            blocked_ids = set(Block.objects.filter(blocker=viewer).values_list('blocked_user_id', flat=True))
+            blocked_by_ids = set(Block.objects.filter(blocked_user=viewer).values_list('blocker_id', flat=True))
+            return DiscoveryIndex.objects.filter(is_active=True)\
+                .exclude(user_id=viewer.id)\
+                .exclude(user_id__in=swiped_ids | blocked_ids | blocked_by_ids)
+
+        def new_query():
+            return candidate_queryset(viewer, profile)
+
+        for label, build in (('id__in', old_query), ('NOT EXISTS', new_query)):
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            try:
+                with transaction.atomic():
+                    self.stdout.write(build().explain())
+                    start = time.perf_counter()
+                    for _ in range(rounds):
+                        count = len(list(build().values_list('user_id', flat=True)))
+                    elapsed = (time.perf_counter() - start) / rounds
+                self.stdout.write(f'{count} candidates in {elapsed * 1000:.1f} ms per call')
+            except DatabaseError as e:
+                # Older SQLite builds cap bound parameters well below 50k
+                self.stdout.write(self.style.ERROR(f'Failed: {e}'))
@@ -0,0 +1,52 @@
+import random
+import time
+from django.core.management.base import BaseCommand
+from matches.scoring import intent_mask, interest_mask, score_batch, score_sets, INTENT_BITS
+
+class Command(BaseCommand):
+    help = 'Compares set based and bitmask compatibility scoring on synthetic candidates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--candidates', type=int, default=5000)
+        parser.add_argument('--interests', type=int, default=40)
+        parser.add_argument('--rounds', type=int, default=20)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(0)
+        intents = list(INTENT_BITS)
+        interests = range(1, options['interests'] + 1)
+        districts = ['ernakulam', 'kollam', 'thrissur', 'kozhikode']
+
+        my_intents = set(rnd.sample(intents, 2))
+        my_interests = set(rnd.sample(interests, 6))
+        my_district = 'ernakulam'
+        candidates = [
+            (rnd.sample(intents, rnd.randint(1, 3)), rnd.sample(interests, rnd.randint(0, 8)), rnd.choice(districts))
+            for _ in range(options['candidates'])
+        ]
+
+        # What the old view did per candidate: build sets, then intersect
+        start = time.perf_counter()
+        for _ in range(options['rounds']):
+            set_scores = [
+                score_sets(my_intents, my_interests, my_district, set(c_intents), set(c_interests), c_district)
+                for c_intents, c_interests, c_district in candidates
+            ]
+        set_time = (time.perf_counter() - start) / options['rounds']
+
+        # Masks are cached on the discovery index, so only the AND/popcount is timed
+        rows = [(intent_mask(i), interest_mask(s), d) for i, s, d in candidates]
+        my_intent_mask, my_interest_mask = intent_mask(my_intents), interest_mask(my_interests)
+        start = time.perf_counter()
+        for _ in range(options['rounds']):
+            mask_scores = score_batch(my_intent_mask, my_interest_mask, my_district, rows)
+        mask_time = (time.perf_counter() - start) / options['rounds']
+
+        if set_scores != mask_scores:
+            self.stdout.write(self.style.ERROR('Scores differ between implementations'))
+            return
+
+        n = options['candidates']
+        self.stdout.write(f'Sets:     {set_time * 1000:.2f} ms per {n} candidates')
+        self.stdout.write(f'Bitmasks: {mask_time * 1000:.2f} ms per {n} candidates')
+        self.stdout.write(self.style.SUCCESS(f'Speedup: {set_time / mask_time:.1f}x, identical scores'))
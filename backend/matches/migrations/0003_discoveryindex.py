@@ -0,0 +1,47 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:18
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_discovery_index(apps, schema_editor):
+    Profile = apps.get_model('profiles', 'Profile')
+    DiscoveryIndex = apps.get_model('matches', 'DiscoveryIndex')
+    DiscoveryIndex.objects.bulk_create([
+        DiscoveryIndex(
+            user_id=p.user_id,
+            gender=p.gender,
+            interested_in=p.interested_in,
+            district=p.district,
+            is_active=p.user.status == 'active',
+        )
+        for p in Profile.objects.select_related('user').iterator()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0002_initial'),
+        ('profiles', '0003_alter_profile_district_alter_profile_dob_and_more'),
+        ('users', '0004_alter_user_daily_swipe_limit'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DiscoveryIndex',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='discovery_entry', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('gender', models.CharField(blank=True, max_length=10, null=True)),
+                ('interested_in', models.CharField(blank=True, max_length=10, null=True)),
+                ('district', models.CharField(max_length=20)),
+                ('is_active', models.BooleanField(default=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['is_active', 'gender', 'district'], name='discovery_bucket_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_discovery_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:20
+
+from django.db import migrations, models
+from matches.scoring import intent_mask, interest_mask, encode_mask
+
+
+def backfill_masks(apps, schema_editor):
+    Profile = apps.get_model('profiles', 'Profile')
+    DiscoveryIndex = apps.get_model('matches', 'DiscoveryIndex')
+    for profile in Profile.objects.prefetch_related('interests').iterator(chunk_size=500):
+        DiscoveryIndex.objects.filter(user_id=profile.user_id).update(
+            intent_mask=intent_mask(profile.relationship_intents),
+            interest_mask=encode_mask(interest_mask(i.id for i in profile.interests.all())),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0003_discoveryindex'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='discoveryindex',
+            name='intent_mask',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='discoveryindex',
+            name='interest_mask',
+            field=models.TextField(default='0'),
+        ),
+        migrations.RunPython(backfill_masks, migrations.RunPython.noop),
+    ]
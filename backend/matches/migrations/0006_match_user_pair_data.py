@@ -0,0 +1,47 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:02
+
+from django.db import migrations
+
+
+def copy_users_to_pair(apps, schema_editor):
+    Match = apps.get_model('matches', 'Match')
+    seen = {}
+    for match in Match.objects.order_by('id').prefetch_related('users'):
+        user_ids = sorted(u.id for u in match.users.all())
+        if len(user_ids) != 2:
+            # Not a real pair, nothing can address it after the migration
+            match.delete()
+            continue
+
+        pair = tuple(user_ids)
+        if pair in seen:
+            # Duplicate created by concurrent likes: keep the earliest match
+            kept = seen[pair]
+            if match.is_active and not kept.is_active:
+                kept.is_active = True
+                kept.save(update_fields=['is_active'])
+            match.delete()
+            continue
+
+        match.user_low_id, match.user_high_id = pair
+        match.save(update_fields=['user_low', 'user_high'])
+        seen[pair] = match
+
+
+def copy_pair_to_users(apps, schema_editor):
+    Match = apps.get_model('matches', 'Match')
+    for match in Match.objects.all():
+        match.users.add(match.user_low_id, match.user_high_id)
+
+
+class Migration(migrations.Migration):
+    # Kept apart from the schema changes: on PostgreSQL the row updates leave
+    # deferred FK trigger events that block an ALTER TABLE in the same transaction
+
+    dependencies = [
+        ('matches', '0005_match_user_pair'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_users_to_pair, copy_pair_to_users),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 6.0.1 on 2026-10-18 13:02
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('matches', '0006_match_user_pair_data'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='match',
+            name='user_low',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='matches_as_low', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='match',
+            name='user_high',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='matches_as_high', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RemoveField(
+            model_name='match',
+            name='users',
+        ),
+        migrations.AddConstraint(
+            model_name='match',
+            constraint=models.UniqueConstraint(fields=('user_low', 'user_high'), name='unique_match_pair'),
+        ),
+        migrations.AddConstraint(
+            model_name='match',
+            constraint=models.CheckConstraint(condition=models.Q(('user_low__lt', models.F('user_high'))), name='match_pair_ordered'),
+        ),
+    ]
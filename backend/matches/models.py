@@ -16,10 +16,95 @@ class Swipe(models.Model):
     class Meta:
         unique_together = ('swiper', 'target')
 
+def ordered_pair(a_id, b_id):
+    """Return the two user ids as ``(low, high)``.
+
+    Raises ValueError for a user paired with themselves, which the
+    match_pair_ordered constraint would reject anyway.
+    """
+    a_id, b_id = int(a_id), int(b_id)
+    if a_id == b_id:
+        raise ValueError("A pair needs two different users")
+    return (a_id, b_id) if a_id < b_id else (b_id, a_id)
+
+class MatchManager(models.Manager):
+    def for_user(self, user):
+        return self.filter(models.Q(user_low=user) | models.Q(user_high=user))
+
+    def between(self, a_id, b_id):
+        """The match between two users, as a single unique-index lookup."""
+        low, high = ordered_pair(a_id, b_id)
+        return self.filter(user_low_id=low, user_high_id=high)
+
+    def with_partner(self, user):
+        """Matches of ``user`` annotated with the other side as ``partner_id``."""
+        return self.for_user(user).annotate(
+            partner_id=models.Case(
+                models.When(user_low=user, then=models.F('user_high_id')),
+                default=models.F('user_low_id'),
+            )
+        )
+
+    def partner_ids(self, user):
+        return self.with_partner(user).values_list('partner_id', flat=True)
+
+    def are_matched(self, user, other_id):
+        try:
+            return self.between(user.id, other_id).exists()
+        except (TypeError, ValueError):
+            return False
+
+    def create_pair(self, a, b):
+        """Idempotently create the match between two users."""
+        low, high = ordered_pair(a.id, b.id)
+        return self.get_or_create(user_low_id=low, user_high_id=high)
+
 class Match(models.Model):
-    users = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name='matches')
+    # Always a pair, stored with user_low.id < user_high.id
+    user_low = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='matches_as_low')
+    user_high = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='matches_as_high')
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
-    
+
+    objects = MatchManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user_low', 'user_high'], name='unique_match_pair'),
+            models.CheckConstraint(condition=models.Q(user_low__lt=models.F('user_high')), name='match_pair_ordered'),
+        ]
+
     def __str__(self):
         return f"Match {self.id}"
+
+    @property
+    def users(self):
+        """Both users, for code written against the old many-to-many field."""
+        return [self.user_low, self.user_high]
+
+    def partner(self, user):
+        return self.user_high if self.user_low_id == user.id else self.user_low
+
+class DiscoveryIndex(models.Model):
+    """Denormalized discovery row for every user with a profile.
+
+    Kept in sync by ``matches.signals`` so discovery can read a bounded,
+    pre-filtered slice per gender/district bucket instead of scanning users.
+    """
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, primary_key=True, related_name='discovery_entry')
+    gender = models.CharField(max_length=10, null=True, blank=True)
+    interested_in = models.CharField(max_length=10, null=True, blank=True)
+    district = models.CharField(max_length=20)
+    is_active = models.BooleanField(default=True)
+    # Scoring bitmasks, see matches.scoring
+    intent_mask = models.BigIntegerField(default=0)
+    interest_mask = models.TextField(default='0')  # hex, interest ids can exceed 64
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['is_active', 'gender', 'district'], name='discovery_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"Discovery entry for {self.user_id}"
@@ -0,0 +1,80 @@
+import time
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q, Exists
+from reports.models import Block
+from users.models import User
+from .models import Match, ordered_pair
+
+# Cached pair state is re-checked at least this often, even without invalidation
+RELATIONSHIP_TTL = 10 * 60
+
+BANNED_STATUSES = ('temp_banned', 'perm_banned')
+
+def _state_key(low, high):
+    return f"pair:{low}:{high}"
+
+def _pair_generation_key(low, high):
+    return f"pair_gen:{low}:{high}"
+
+def _user_generation_key(user_id):
+    return f"pair_gen_user:{user_id}"
+
+def relationship(user_id, partner_id):
+    """Return ``{"matched", "blocked"}`` for a pair, from the cache when possible.
+
+    ``blocked`` is also set when either user is banned or deactivated. Each
+    cached entry records the pair's and both users' generation counters as
+    read before the database was queried; invalidation bumps a counter, so an
+    entry computed from data that changed in the meantime is never served.
+    Returns None if either id is not a valid integer.
+    """
+    try:
+        low, high = ordered_pair(user_id, partner_id)
+    except (TypeError, ValueError):
+        return None
+
+    keys = [_state_key(low, high), _pair_generation_key(low, high), _user_generation_key(low), _user_generation_key(high)]
+    found = cache.get_many(keys)
+    generations = tuple(found.get(key) for key in keys[1:])
+    cached = found.get(keys[0])
+    if cached is not None and cached[0] == generations:
+        return cached[1]
+
+    state = _load(low, high)
+    cache.set(keys[0], (generations, state), RELATIONSHIP_TTL)
+    return state
+
+def _load(low, high):
+    pair_blocks = Block.objects.filter(
+        Q(blocker_id=low, blocked_user_id=high) | Q(blocker_id=high, blocked_user_id=low)
+    )
+    users = list(User.objects.filter(pk__in=[low, high]).annotate(
+        blocked=Exists(pair_blocks),
+        matched=Exists(Match.objects.between(low, high)),
+    ).values('status', 'is_active', 'blocked', 'matched'))
+
+    if len(users) < 2:
+        # One side does not exist
+        return {"matched": False, "blocked": False}
+    banned = any(u['status'] in BANNED_STATUSES or not u['is_active'] for u in users)
+    return {"matched": users[0]['matched'], "blocked": users[0]['blocked'] or banned}
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Not cached yet; start from a value no earlier entry can have recorded
+        cache.set(key, time.time_ns(), None)
+
+def invalidate_pair(user_id, partner_id):
+    """Drop the cached state of one pair once the current transaction commits."""
+    if user_id == partner_id:
+        # A self-block, say; no pair state is ever cached for it
+        return
+    low, high = ordered_pair(user_id, partner_id)
+    transaction.on_commit(lambda: _bump(_pair_generation_key(low, high)))
+
+def invalidate_user(user_id):
+    """Drop the cached state of every pair involving ``user_id`` after commit."""
+    transaction.on_commit(lambda: _bump(_user_generation_key(user_id)))
@@ -0,0 +1,64 @@
+import zlib
+
+# Bit positions for the intents offered by the profile setup screen
+INTENT_BITS = {
+    'Marriage': 0,
+    'Serious Dating': 1,
+    'Friendship': 2,
+    'Situationship': 3,
+    'Casual': 4,
+}
+# Any other intent string is hashed onto the remaining bits of a signed 64-bit column
+_SPARE_INTENT_BITS = 63 - len(INTENT_BITS)
+
+INTENT_POINTS = 10
+INTEREST_POINTS = 2
+DISTRICT_POINTS = 5
+
+def intent_bit(intent):
+    bit = INTENT_BITS.get(intent)
+    if bit is None:
+        bit = len(INTENT_BITS) + zlib.crc32(str(intent).encode()) % _SPARE_INTENT_BITS
+    return bit
+
+def intent_mask(intents):
+    mask = 0
+    for intent in intents or ():
+        mask |= 1 << intent_bit(intent)
+    return mask
+
+def interest_mask(interest_ids):
+    mask = 0
+    for interest_id in interest_ids:
+        mask |= 1 << interest_id
+    return mask
+
+def encode_mask(mask):
+    return format(mask, 'x')
+
+def decode_mask(value):
+    return int(value, 16) if value else 0
+
+def score_batch(my_intent_mask, my_interest_mask, my_district, rows):
+    """Score ``(intent_mask, interest_mask, district)`` rows against the viewer.
+
+    Same rules as the set based scorer: +10 for any shared intent, +2 per
+    shared interest, +5 for the same district.
+    """
+    return [
+        (INTENT_POINTS if c_intents & my_intent_mask else 0)
+        + INTEREST_POINTS * (c_interests & my_interest_mask).bit_count()
+        + (DISTRICT_POINTS if c_district == my_district else 0)
+        for c_intents, c_interests, c_district in rows
+    ]
+
+def score_sets(my_intents, my_interests, my_district, c_intents, c_interests, c_district):
+    """Reference scorer over plain sets, kept for parity tests and benchmarks."""
+    score = 0
+    # Intent
+    if my_intents.intersection(c_intents): score += INTENT_POINTS
+    # Interest
+    score += len(my_interests.intersection(c_interests)) * INTEREST_POINTS
+    # District
+    if c_district == my_district: score += DISTRICT_POINTS
+    return score
@@ -0,0 +1,54 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from profiles.models import Profile
+from reports.models import Block
+from users.models import User
+from .models import DiscoveryIndex, Match
+from .relationships import invalidate_pair, invalidate_user
+from .scoring import intent_mask, interest_mask, encode_mask
+
+@receiver(post_save, sender=Profile)
+def sync_discovery_index(sender, instance, **kwargs):
+    # Profiles are re-saved on every user save, so this also tracks status changes
+    DiscoveryIndex.objects.update_or_create(
+        user_id=instance.user_id,
+        defaults={
+            'gender': instance.gender,
+            'interested_in': instance.interested_in,
+            'district': instance.district,
+            'is_active': instance.user.status == 'active',
+            'intent_mask': intent_mask(instance.relationship_intents),
+        }
+    )
+
+@receiver(m2m_changed, sender=Profile.interests.through)
+def sync_interest_mask(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+
+    if reverse:
+        # Interest.profile_set changed; pk_set holds profile ids (None on clear)
+        profiles = Profile.objects.filter(pk__in=pk_set) if pk_set is not None else Profile.objects.none()
+    else:
+        profiles = [instance]
+
+    for profile in profiles:
+        DiscoveryIndex.objects.filter(user_id=profile.user_id).update(
+            interest_mask=encode_mask(interest_mask(profile.interests.values_list('id', flat=True)))
+        )
+
+@receiver(post_save, sender=Block)
+@receiver(post_delete, sender=Block)
+def invalidate_block_pair(sender, instance, **kwargs):
+    invalidate_pair(instance.blocker_id, instance.blocked_user_id)
+
+@receiver(post_save, sender=Match)
+@receiver(post_delete, sender=Match)
+def invalidate_match_pair(sender, instance, **kwargs):
+    invalidate_pair(instance.user_low_id, instance.user_high_id)
+
+@receiver(post_save, sender=User)
+def invalidate_user_pairs(sender, instance, update_fields=None, **kwargs):
+    # Bans and deactivation change every pair; skip saves like last_login updates
+    if update_fields is None or {'status', 'is_active'} & set(update_fields):
+        invalidate_user(instance.pk)
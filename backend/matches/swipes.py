@@ -0,0 +1,83 @@
+from django.db.models import F
+from django.utils import timezone
+from users.models import User
+from .models import Swipe, Match, ordered_pair
+from .relationships import invalidate_pair
+
+def lock_users(user_ids):
+    """Row-lock users in id order for the rest of the transaction.
+
+    Swipes between the same users then run one after the other, so two
+    simultaneous likes always see each other, and the fixed order cannot
+    deadlock.
+    """
+    list(User.objects.select_for_update().filter(pk__in=user_ids).order_by('pk').values_list('pk', flat=True))
+
+def lock_pair(a_id, b_id):
+    lock_users(ordered_pair(a_id, b_id))
+
+def take_swipe_quota(user_id, count=1):
+    """Reserve ``count`` swipes from today's quota with conditional UPDATEs.
+
+    Returns False, without reserving anything, if that would exceed the limit.
+    """
+    today = timezone.now().date()
+    User.objects.filter(pk=user_id, last_swipe_date__lt=today).update(swipes_today=0, last_swipe_date=today)
+    return User.objects.filter(pk=user_id, swipes_today__lte=F('daily_swipe_limit') - count)\
+        .update(swipes_today=F('swipes_today') + count) == 1
+
+def reserve_swipes(user_id, count):
+    """Reserve up to ``count`` swipes from today's quota; returns how many were granted."""
+    today = timezone.now().date()
+    User.objects.filter(pk=user_id, last_swipe_date__lt=today).update(swipes_today=0, last_swipe_date=today)
+    used, limit = User.objects.select_for_update().filter(pk=user_id)\
+        .values_list('swipes_today', 'daily_swipe_limit').get()
+    granted = max(0, min(count, limit - used))
+    if granted:
+        User.objects.filter(pk=user_id).update(swipes_today=F('swipes_today') + granted)
+    return granted
+
+def record_swipe(user, target_user, action):
+    """Store the swipe and create the match on a mutual like. Returns is_match.
+
+    Call inside a transaction that holds ``lock_pair`` for the two users.
+    """
+    Swipe.objects.update_or_create(
+        swiper=user, target=target_user,
+        defaults={'action': action}
+    )
+
+    # Check for Match
+    if action == 'like' and Swipe.objects.filter(swiper=target_user, target=user, action='like').exists():
+        # Idempotent: the pair is unique, so a repeated like reuses the match
+        Match.objects.create_pair(user, target_user)
+        return True
+    return False
+
+def record_swipes(user, actions):
+    """Bulk version of ``record_swipe`` for a ``{target_id: action}`` dict.
+
+    Upserts all swipes in one statement, finds every reciprocal like with one
+    query and creates the missing matches in one insert. Returns the set of
+    target ids that are now matches. Call inside a transaction that holds
+    ``lock_users`` for the user and the liked targets.
+    """
+    Swipe.objects.bulk_create(
+        [Swipe(swiper=user, target_id=target_id, action=action) for target_id, action in actions.items()],
+        update_conflicts=True,
+        unique_fields=['swiper', 'target'],
+        update_fields=['action'],
+    )
+
+    liked = [target_id for target_id, action in actions.items() if action == 'like']
+    matched = set(Swipe.objects.filter(swiper_id__in=liked, target=user, action='like')
+        .values_list('swiper_id', flat=True))
+
+    Match.objects.bulk_create([
+        Match(user_low_id=low, user_high_id=high)
+        for low, high in (ordered_pair(user.id, target_id) for target_id in matched)
+    ], ignore_conflicts=True)
+    # bulk_create sends no post_save, so drop the cached pair state here
+    for target_id in matched:
+        invalidate_pair(user.id, target_id)
+    return matched
@@ -1,3 +1,348 @@
-from django.test import TestCase
+import random
+import threading
+from django.core.cache import cache
+from django.db import connection, DatabaseError
+from django.utils import timezone
+from django.test import TestCase, SimpleTestCase, TransactionTestCase, skipUnlessDBFeature
+from rest_framework.test import APIClient
+from users.models import User
+from profiles.models import Interest
+from reports.models import Block
+from .models import DiscoveryIndex, Match, Swipe
+from . import deck
+from .discovery import candidate_pool, rank_candidates, rank_in_database
+from .scoring import intent_mask, interest_mask, decode_mask, score_batch, score_sets
 
-# Create your tests here.
+INTENTS = ['Marriage', 'Serious Dating', 'Friendship', 'Situationship', 'Casual', 'Something else']
+DISTRICTS = ['ernakulam', 'kollam', 'thrissur']
+
+class ScoringParityTests(SimpleTestCase):
+    def test_bitmask_scores_match_set_scores(self):
+        rnd = random.Random(42)
+        for _ in range(50):
+            my_intents = set(rnd.sample(INTENTS, rnd.randint(0, 3)))
+            my_interests = set(rnd.sample(range(1, 100), rnd.randint(0, 10)))
+            my_district = rnd.choice(DISTRICTS)
+
+            candidates = [
+                (rnd.sample(INTENTS, rnd.randint(0, 3)), set(rnd.sample(range(1, 100), rnd.randint(0, 10))), rnd.choice(DISTRICTS))
+                for _ in range(100)
+            ]
+            expected = [score_sets(my_intents, my_interests, my_district, *c) for c in candidates]
+            got = score_batch(intent_mask(my_intents), interest_mask(my_interests), my_district, [
+                (intent_mask(intents), interest_mask(interests), district)
+                for intents, interests, district in candidates
+            ])
+            self.assertEqual(got, expected)
+
+class DiscoveryIndexTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='a@example.com', password='pass1234')
+        self.profile = self.user.profile
+
+    def test_profile_changes_update_index(self):
+        self.profile.gender = 'female'
+        self.profile.district = 'kollam'
+        self.profile.relationship_intents = ['Marriage']
+        self.profile.save()
+
+        entry = DiscoveryIndex.objects.get(user=self.user)
+        self.assertEqual((entry.gender, entry.district), ('female', 'kollam'))
+        self.assertEqual(entry.intent_mask, intent_mask(['Marriage']))
+
+    def test_interest_changes_update_mask(self):
+        music, travel = Interest.objects.create(name='Music'), Interest.objects.create(name='Travel')
+        self.profile.interests.set([music, travel])
+        entry = DiscoveryIndex.objects.get(user=self.user)
+        self.assertEqual(decode_mask(entry.interest_mask), interest_mask([music.id, travel.id]))
+
+        music.profile_set.remove(self.profile)
+        entry.refresh_from_db()
+        self.assertEqual(decode_mask(entry.interest_mask), interest_mask([travel.id]))
+
+    def test_banned_users_leave_the_pool(self):
+        self.user.status = 'temp_banned'
+        self.user.save()
+        self.assertFalse(DiscoveryIndex.objects.get(user=self.user).is_active)
+
+class RankingParityTests(TestCase):
+    def test_sql_and_python_rankings_agree(self):
+        rnd = random.Random(7)
+        interests = [Interest.objects.create(name=f'Interest {i}') for i in range(8)]
+
+        viewer = User.objects.create_user(email='viewer@example.com', password='pass1234')
+        profile = viewer.profile
+        profile.gender, profile.interested_in, profile.district = 'male', 'female', 'ernakulam'
+        profile.relationship_intents = ['Marriage', 'Friendship']
+        profile.save()
+        profile.interests.set(interests[:4])
+
+        for i in range(30):
+            user = User.objects.create_user(email=f'c{i}@example.com', password='pass1234')
+            p = user.profile
+            p.gender = rnd.choice(['female', 'female', 'male'])
+            p.district = rnd.choice(DISTRICTS)
+            p.relationship_intents = rnd.sample(INTENTS, rnd.randint(0, 2))
+            p.save()
+            p.interests.set(rnd.sample(interests, rnd.randint(0, 5)))
+
+        python_ranking = rank_candidates(profile, candidate_pool(viewer, profile), k=10)
+        sql_ranking = rank_in_database(viewer, profile, k=10)
+        self.assertEqual(len(sql_ranking), 10)
+        self.assertEqual(sql_ranking, python_ranking)
+
+class QueryCountTests(TestCase):
+    """Locks the number of queries of the discovery and match endpoints."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(email='me@example.com', password='pass1234')
+        profile = self.user.profile
+        profile.gender, profile.interested_in = 'male', 'female'
+        profile.save()
+
+        self.partners = []
+        for i in range(5):
+            other = User.objects.create_user(email=f'p{i}@example.com', password='pass1234')
+            other.profile.gender = 'female'
+            other.profile.save()
+            Match.objects.create_pair(self.user, other)
+            self.partners.append(other)
+        for i in range(5):
+            other = User.objects.create_user(email=f'c{i}@example.com', password='pass1234')
+            other.profile.gender = 'female'
+            other.profile.save()
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_partner_ids(self):
+        with self.assertNumQueries(1):
+            ids = set(Match.objects.partner_ids(self.user))
+        self.assertEqual(ids, {p.id for p in self.partners})
+
+    def test_discovery_queries(self):
+        # profile, viewer interests, pool, cards (users + photos)
+        with self.assertNumQueries(5):
+            res = self.client.get('/api/discovery/')
+        self.assertEqual(len(res.data), 5)
+        self.assertFalse({c['user_id'] for c in res.data} & {p.id for p in self.partners})
+
+    def test_match_list_queries(self):
+        Block.objects.create(blocker=self.partners[0], blocked_user=self.user)
+        # partner links with profiles, then photos
+        with self.assertNumQueries(2):
+            res = self.client.get('/api/matches/')
+        self.assertEqual([m['user_id'] for m in res.data], [p.id for p in self.partners[1:]])
+
+class DiscoveryDeckTests(TestCase):
+    def setUp(self):
+        # Decks live in the cache, which outlives each test's transaction
+        cache.clear()
+        self.user = User.objects.create_user(email='me@example.com', password='pass1234')
+        profile = self.user.profile
+        profile.gender, profile.interested_in = 'male', 'female'
+        profile.save()
+
+        self.candidates = []
+        for i in range(deck.PAGE_SIZE * 2 + 5):
+            other = User.objects.create_user(email=f'c{i}@example.com', password='pass1234')
+            other.profile.gender = 'female'
+            other.profile.save()
+            self.candidates.append(other)
+
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def page(self, cursor=None):
+        res = self.client.get('/api/discovery/deck/', {'cursor': cursor} if cursor else {})
+        self.assertEqual(res.status_code, 200)
+        return [c['user_id'] for c in res.data['results']], res.data['cursor']
+
+    def deal_all(self, cursor=None):
+        """Page through the rest of a deck; returns the dealt ids and the number of pages."""
+        dealt, pages = [], 0
+        while True:
+            ids, cursor = self.page(cursor)
+            dealt += ids
+            pages += 1
+            if cursor is None:
+                return dealt, pages
+
+    def test_pages_cover_the_deck_once(self):
+        dealt, pages = self.deal_all()
+        self.assertEqual(pages, 3)
+        self.assertEqual(len(dealt), len(set(dealt)))
+        self.assertEqual(set(dealt), {c.id for c in self.candidates})
+
+    def test_swiped_entries_are_not_dealt(self):
+        first, cursor = self.page()
+        swiped = self.candidates[-1]
+        self.assertNotIn(swiped.id, first)
+        self.client.post('/api/swipe/', {'target_id': swiped.id, 'action': 'dislike'})
+
+        rest, _ = self.deal_all(cursor)
+        self.assertNotIn(swiped.id, rest)
+        self.assertEqual(len(first + rest), len(self.candidates) - 1)
+
+    def test_blocked_and_banned_candidates_are_skipped(self):
+        first, cursor = self.page()
+        blocked, banned = self.candidates[-1], self.candidates[-2]
+        Block.objects.create(blocker=blocked, blocked_user=self.user)
+        banned.status = 'temp_banned'
+        banned.save()
+
+        rest, _ = self.deal_all(cursor)
+        self.assertFalse({blocked.id, banned.id} & set(rest))
+        self.assertEqual(len(first + rest), len(self.candidates) - 2)
+
+    def test_bad_cursors_deal_a_fresh_deck(self):
+        first, cursor = self.page()
+        other = User.objects.create_user(email='other@example.com', password='pass1234')
+        self.assertIsNone(deck.next_page(other, cursor))
+        payload, signature = cursor.rsplit(':', 1)
+        tampered = f'{payload}:{signature[::-1]}'
+        self.assertIsNone(deck.next_page(self.user, tampered))
+
+        # The view starts over from the first page
+        ids, fresh_cursor = self.page(tampered)
+        self.assertEqual(ids, first)
+        self.assertNotEqual(deck.read_cursor(fresh_cursor)[0], deck.read_cursor(cursor)[0])
+
+class SwipeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='me@example.com', password='pass1234')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_swiping_on_yourself_is_rejected(self):
+        res = self.client.post('/api/swipe/', {'target_id': self.user.id, 'action': 'like'})
+        self.assertEqual(res.status_code, 400)
+        self.assertFalse(Swipe.objects.exists())
+        self.assertFalse(Match.objects.exists())
+
+    def test_a_user_cannot_be_paired_with_themselves(self):
+        with self.assertRaises(ValueError):
+            Match.objects.create_pair(self.user, self.user)
+
+class SwipeBatchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='me@example.com', password='pass1234')
+        self.targets = [User.objects.create_user(email=f't{i}@example.com', password='pass1234') for i in range(5)]
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def batch(self, swipes):
+        res = self.client.post('/api/swipe/batch/', {'swipes': swipes}, format='json')
+        self.assertEqual(res.status_code, 200)
+        return res.data['results']
+
+    def likes(self, targets):
+        return [{'target_id': t.id, 'action': 'like'} for t in targets]
+
+    def test_earliest_swipes_win_past_the_limit(self):
+        User.objects.filter(pk=self.user.pk).update(
+            daily_swipe_limit=3, swipes_today=1, last_swipe_date=timezone.now().date()
+        )
+        results = self.batch(self.likes(self.targets[:4]))
+
+        self.assertEqual([r['status'] for r in results], ['success', 'success', 'limit_reached', 'limit_reached'])
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.swipes_today, 3)
+        self.assertEqual(set(Swipe.objects.values_list('target_id', flat=True)), {t.id for t in self.targets[:2]})
+
+    def test_last_action_on_a_target_wins(self):
+        target = self.targets[0]
+        results = self.batch([{'target_id': target.id, 'action': 'like'}, {'target_id': target.id, 'action': 'dislike'}])
+
+        self.assertEqual([r['status'] for r in results], ['success', 'success'])
+        self.assertEqual(Swipe.objects.get().action, 'dislike')
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.swipes_today, 1)
+
+    def test_reciprocal_like_makes_one_match(self):
+        target = self.targets[0]
+        Swipe.objects.create(swiper=target, target=self.user, action='like')
+
+        results = self.batch(self.likes([target, target, self.targets[1]]))
+        self.assertEqual([r['is_match'] for r in results], [True, True, False])
+        # Sending the batch again reuses the match
+        self.batch(self.likes([target]))
+        self.assertEqual(Match.objects.get().partner(self.user), target)
+
+    def test_invalid_items(self):
+        results = self.batch([
+            {'target_id': self.user.id, 'action': 'like'},
+            {'target_id': 'abc', 'action': 'like'},
+            {'target_id': self.targets[0].id, 'action': 'superlike'},
+            {'target_id': self.targets[-1].id + 1000, 'action': 'like'},
+        ])
+        self.assertEqual([r['status'] for r in results], ['invalid', 'invalid', 'invalid', 'not_found'])
+        self.assertFalse(Swipe.objects.exists())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.swipes_today, 0)
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        # targets, savepoint, lock, quota reset, quota read, quota update,
+        # swipe upsert, reciprocal likes, release
+        with self.assertNumQueries(9):
+            self.batch(self.likes(self.targets[:1]))
+        with self.assertNumQueries(9):
+            self.batch(self.likes(self.targets[1:]))
+
+@skipUnlessDBFeature('has_select_for_update')
+class SwipeContentionTests(TransactionTestCase):
+    """Hammers the swipe endpoint from many threads at once.
+
+    Needs a database with row locks (PostgreSQL); SQLite's shared in-memory
+    test database fails concurrent readers instead of making them wait.
+    """
+
+    def swipe_concurrently(self, jobs):
+        """Run ``(user, target, action)`` swipes in parallel threads; returns status codes."""
+        barrier = threading.Barrier(len(jobs))
+        codes = []
+
+        def worker(user, target, action):
+            client = APIClient()
+            client.force_authenticate(user)
+            barrier.wait()
+            try:
+                codes.append(client.post('/api/swipe/', {'target_id': target.id, 'action': action}).status_code)
+            except DatabaseError:
+                codes.append(None)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker, args=job) for job in jobs]
+        for t in threads: t.start()
+        for t in threads: t.join()
+        return codes
+
+    def test_daily_limit_is_never_exceeded(self):
+        user = User.objects.create_user(email='swiper@example.com', password='pass1234')
+        User.objects.filter(pk=user.pk).update(daily_swipe_limit=5)
+        targets = [User.objects.create_user(email=f't{i}@example.com', password='pass1234') for i in range(20)]
+
+        codes = self.swipe_concurrently([(user, t, 'dislike') for t in targets])
+
+        user.refresh_from_db()
+        swipes = Swipe.objects.filter(swiper=user).count()
+        self.assertEqual(sorted(codes), [200] * 5 + [403] * 15)
+        self.assertEqual(swipes, 5)
+        self.assertEqual(user.swipes_today, 5)
+
+    def test_mutual_likes_create_exactly_one_match(self):
+        pairs = [
+            (User.objects.create_user(email=f'a{i}@example.com', password='pass1234'),
+             User.objects.create_user(email=f'b{i}@example.com', password='pass1234'))
+            for i in range(5)
+        ]
+        jobs = []
+        for a, b in pairs:
+            jobs += [(a, b, 'like'), (b, a, 'like')] * 2
+
+        codes = self.swipe_concurrently(jobs)
+        self.assertEqual(codes, [200] * len(jobs))
+
+        for a, b in pairs:
+            self.assertEqual(Match.objects.between(a.id, b.id).count(), 1)
@@ -1,9 +1,14 @@
 
 from rest_framework import views, response, status, permissions, generics
-from .models import Swipe, Match
-from profiles.models import Profile
+from .models import Match
+from .discovery import candidate_pool, rank_candidates, rank_in_database, build_cards
+from .deck import deal_deck, next_page, consume_deck_entry, consume_deck_entries
+from .swipes import lock_pair, lock_users, take_swipe_quota, reserve_swipes, record_swipe, record_swipes
+from profiles.models import Profile, UserPhoto
+from profiles.photos import photo_url
 from reports.models import Block
-from django.db.models import Q
+from django.db import connection, transaction
+from django.db.models import Q, Prefetch, prefetch_related_objects
 from users.models import User
 import random
 
@@ -14,99 +19,65 @@ class DiscoveryView(views.APIView):
         user = request.user
         profile, created = Profile.objects.get_or_create(user=user)
 
-        # Basic filtering logic
-        # 1. Not myself
-        # 2. Not already swiped
-        matches = Match.objects.filter(users=user)
-        matched_ids = set()
-        for m in matches:
-             for u in m.users.all():
-                 if u.id != user.id: matched_ids.add(u.id)
-
-        swiped_ids = set(Swipe.objects.filter(swiper=user).values_list('target_id', flat=True))
-        blocked_ids = set(Block.objects.filter(blocker=user).values_list('blocked_user_id', flat=True))
-        blocked_by_ids = set(Block.objects.filter(blocked_user=user).values_list('blocker_id', flat=True))
-
-        # 1. New Candidates (Unswiped)
-        # Optimize with prefetch/select_related to avoid N+1 queries
-        candidates = User.objects.exclude(id=user.id)\
-            .exclude(id__in=swiped_ids)\
-            .exclude(id__in=blocked_ids)\
-            .exclude(id__in=blocked_by_ids)\
-            .filter(status='active')\
-            .select_related('profile')\
-            .prefetch_related('photos', 'profile__interests')
-
-        # Filter by gender interest
-        if profile.interested_in == 'male':
-            candidates = candidates.filter(profile__gender='male')
-        elif profile.interested_in == 'female':
-            candidates = candidates.filter(profile__gender='female')
-
-        # Combined Processing
-        my_intents = set(profile.relationship_intents)
-        my_interests = set(profile.interests.values_list('id', flat=True))
-
-        def score_user(c):
-             if not hasattr(c, 'profile'): return None
-             score = 0
-             c_profile = c.profile
-             
-             # Intent
-             c_intents = set(c_profile.relationship_intents)
-             if my_intents.intersection(c_intents): score += 10
-             
-             # Interest
-             c_interests = set(i.id for i in c_profile.interests.all()) # Optimized to use prefetch
-             score += len(my_interests.intersection(c_interests)) * 2
-             
-             # District
-             if c_profile.district == profile.district: score += 5
-             
-             return {
-                "user_id": c.id,
-                "first_name": c_profile.first_name,
-                "age": c_profile.age,
-                "district": c_profile.district,
-                "bio": c_profile.bio,
-                "photos": [p.image.url for p in c.photos.all()],
-                "score": score
-            }
-
-        scored_results = []
-        for c in candidates:
-            res = score_user(c)
-            if res: scored_results.append(res)
-            
-        # Sort by compatibility score
-        scored_results.sort(key=lambda x: x['score'], reverse=True)
-        
-        return response.Response(scored_results[:10])
+        if connection.vendor == 'postgresql':
+            # Score and LIMIT in SQL, only the top rows come back
+            ranked = rank_in_database(user, profile)
+        else:
+            # 1. New Candidates (Unswiped), pulled as a bounded slice of the index
+            pool = candidate_pool(user, profile)
+            # 2. Score in chunks, keep the top K
+            ranked = rank_candidates(profile, pool)
+
+        # Serialize only the winners
+        return response.Response(build_cards(ranked))
+
+class DiscoveryDeckView(views.APIView):
+    permission_classes = (permissions.IsAuthenticated,)
+
+    def get(self, request):
+        user = request.user
+        cursor = request.query_params.get('cursor')
+
+        page = next_page(user, cursor) if cursor else None
+        if page is None:
+            # First call, or the deck expired: rank once and cache the deck
+            profile, created = Profile.objects.get_or_create(user=user)
+            cursor = deal_deck(user, profile)
+            page = next_page(user, cursor)
+
+        cards, next_cursor = page
+        return response.Response({
+            "results": cards,
+            "cursor": next_cursor
+        })
 
 class MatchListView(generics.ListAPIView):
     permission_classes = (permissions.IsAuthenticated,)
     
     def get(self, request):
         user = request.user
-        matches = Match.objects.filter(users=user)
-        
-        blocked_ids = set(Block.objects.filter(blocker=user).values_list('blocked_user_id', flat=True))
-        blocked_by_ids = set(Block.objects.filter(blocked_user=user).values_list('blocker_id', flat=True))
+        matches = list(Match.objects.with_partner(user)
+            .exclude(partner_id__in=Block.objects.filter(blocker=user).values('blocked_user_id'))
+            .exclude(partner_id__in=Block.objects.filter(blocked_user=user).values('blocker_id'))
+            .select_related('user_low__profile', 'user_high__profile')
+            .order_by('id'))
+        # One photo query for all partners, primary photo first
+        prefetch_related_objects(
+            [m.partner(user) for m in matches],
+            Prefetch('photos', queryset=UserPhoto.objects.order_by('-is_primary', 'id'))
+        )
         
         results = []
         for m in matches:
-            other_user = m.users.exclude(id=user.id).first()
-            if not other_user: continue
-            if other_user.id in blocked_ids or other_user.id in blocked_by_ids: continue
-            
+            other_user = m.partner(user)
             profile = getattr(other_user, 'profile', None)
-            photo = other_user.photos.filter(is_primary=True).first() or other_user.photos.first()
+            photo = next(iter(other_user.photos.all()), None)
             
             results.append({
                 "id": m.id,
                 "user_id": other_user.id,
                 "name": profile.first_name if profile else "User",
-                "photo": photo.image.url if photo else None,
+                "photo": photo_url(photo, 'thumb') if photo else None,
                 "last_message": "No messages yet"
             })
             
@@ -119,40 +90,95 @@ class SwipeView(views.APIView):
         target_id = request.data.get('target_id')
         action = request.data.get('action') # 'like' or 'dislike'
         
-        if not target_id or action not in ['like', 'dislike']:
+        try:
+            target_id = int(target_id)
+        except (TypeError, ValueError):
+            target_id = None
+        if target_id is None or action not in ['like', 'dislike']:
             return response.Response({"error": "Invalid data"}, status=status.HTTP_400_BAD_REQUEST)
         
         user = request.user
-        
-        # Check swipe limits
-        from django.utils import timezone
-        if user.last_swipe_date < timezone.now().date():
-            user.swipes_today = 0
-            user.last_swipe_date = timezone.now().date()
-            user.save()
-
-        if user.swipes_today >= user.daily_swipe_limit:
-             return response.Response({"error": "Daily swipe limit reached."}, status=status.HTTP_403_FORBIDDEN)
-
-        target_user = User.objects.get(id=target_id)
-        swipe, created = Swipe.objects.update_or_create(
-            swiper=user, target=target_user,
-            defaults={'action': action}
-        )
-        
-        user.swipes_today += 1
-        user.save()
-
-        # Check for Match
-        is_match = False
-        if action == 'like':
-            reverse_swipe = Swipe.objects.filter(swiper=target_user, target=user, action='like').exists()
-            if reverse_swipe:
-                match = Match.objects.create()
-                match.users.add(user, target_user)
-                is_match = True
+        if target_id == user.id:
+            return response.Response({"error": "You cannot swipe on yourself."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            target_user = User.objects.get(id=target_id)
+        except User.DoesNotExist:
+            return response.Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        with transaction.atomic():
+            lock_pair(user.id, target_user.id)
+
+            # Check swipe limits
+            if not take_swipe_quota(user.id):
+                return response.Response({"error": "Daily swipe limit reached."}, status=status.HTTP_403_FORBIDDEN)
+
+            is_match = record_swipe(user, target_user, action)
+
+        consume_deck_entry(user.id, target_user.id)
         
         return response.Response({
             "status": "success",
             "is_match": is_match
         })
+
+class SwipeBatchView(views.APIView):
+    """Applies a queue of offline swipes with one quota check and bulk writes."""
+    permission_classes = (permissions.IsAuthenticated,)
+    MAX_SWIPES = 100
+
+    def post(self, request):
+        items = request.data.get('swipes') if isinstance(request.data, dict) else request.data
+        if not isinstance(items, list) or not items:
+            return response.Response({"error": "Invalid data"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > self.MAX_SWIPES:
+            return response.Response({"error": f"At most {self.MAX_SWIPES} swipes per batch."}, status=status.HTTP_400_BAD_REQUEST)
+
+        user = request.user
+
+        # Parse in order; a later swipe on the same target overrides an earlier one
+        results = []
+        actions = {}
+        for item in items:
+            item = item if isinstance(item, dict) else {}
+            action = item.get('action')
+            try:
+                target_id = int(item.get('target_id'))
+            except (TypeError, ValueError):
+                target_id = None
+
+            if target_id is None or target_id == user.id or action not in ['like', 'dislike']:
+                results.append({"target_id": item.get('target_id'), "status": "invalid", "is_match": False})
+                continue
+            actions[target_id] = action
+            results.append({"target_id": target_id, "status": None, "is_match": False})
+
+        existing = set(User.objects.filter(id__in=actions).values_list('id', flat=True))
+        actions = {t: a for t, a in actions.items() if t in existing}
+
+        accepted, matched = {}, set()
+        if actions:
+            with transaction.atomic():
+                lock_users([user.id] + [t for t, a in actions.items() if a == 'like'])
+
+                # Check swipe limits once for the whole batch; the earliest swipes win
+                granted = reserve_swipes(user.id, len(actions))
+                accepted = dict(list(actions.items())[:granted])
+                if accepted:
+                    matched = record_swipes(user, accepted)
+
+            consume_deck_entries(user.id, list(accepted))
+
+        for result in results:
+            if result["status"] is not None:
+                continue
+            target_id = result["target_id"]
+            if target_id not in existing:
+                result["status"] = "not_found"
+            elif target_id in accepted:
+                result["status"] = "success"
+                result["is_match"] = target_id in matched
+            else:
+                result["status"] = "limit_reached"
+
+        return response.Response({"results": results})
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from profiles.models import UserPhoto
+from profiles.photos import process_photo
+
+class Command(BaseCommand):
+    help = 'Writes size variants for photos uploaded before the photo pipeline existed (safe to re-run)'
+
+    def handle(self, *args, **options):
+        pending = UserPhoto.objects.filter(thumb='').exclude(image='').values_list('id', flat=True)
+        done = failed = 0
+        for photo_id in pending.iterator():
+            try:
+                process_photo(photo_id)
+                done += 1
+            except OSError as e:
+                # Missing or unreadable file, keep going with the rest
+                failed += 1
+                self.stderr.write(f'Photo {photo_id}: {e}')
+        self.stdout.write(self.style.SUCCESS(f'Processed {done} photos, {failed} failed'))
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0003_alter_profile_district_alter_profile_dob_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userphoto',
+            name='card',
+            field=models.ImageField(blank=True, upload_to='profile_photos/'),
+        ),
+        migrations.AddField(
+            model_name='userphoto',
+            name='thumb',
+            field=models.ImageField(blank=True, upload_to='profile_photos/'),
+        ),
+    ]
@@ -78,7 +78,11 @@ class Profile(models.Model):
 
 class UserPhoto(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='photos')
+    # The upload, replaced by its downscaled, EXIF-free version once processed
     image = models.ImageField(upload_to='profile_photos/')
+    # Smaller variants written by profiles.photos, empty until then
+    thumb = models.ImageField(upload_to='profile_photos/', blank=True)
+    card = models.ImageField(upload_to='profile_photos/', blank=True)
     is_primary = models.BooleanField(default=False)
     is_approved = models.BooleanField(default=False)
     uploaded_at = models.DateTimeField(auto_now_add=True)
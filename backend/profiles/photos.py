@@ -0,0 +1,72 @@
+import os
+from io import BytesIO
+from django.core.files.base import ContentFile
+from django.db.models import CharField, F, Value
+from django.db.models.functions import Coalesce, NullIf
+from PIL import Image, ImageOps, features
+from .models import UserPhoto
+
+# Variant -> (bounding box, crop to fill it). Thumbs are square avatars for
+# lists; cards and the full photo keep their aspect ratio and only shrink.
+VARIANTS = {
+    'thumb': ((192, 192), True),
+    'card': ((720, 960), False),
+    'full': ((1600, 1600), False),
+}
+
+# WebP where this Pillow build can write it, JPEG otherwise
+VARIANT_FORMAT, VARIANT_EXTENSION = ('WEBP', 'webp') if features.check('webp') else ('JPEG', 'jpg')
+VARIANT_QUALITY = 80
+
+def photo_url(photo, variant):
+    """URL of a photo's ``variant`` ('thumb', 'card' or 'full').
+
+    Falls back to the upload until the background pass has run.
+    """
+    field = photo.image if variant == 'full' else getattr(photo, variant)
+    return (field or photo.image).url
+
+def variant_name(variant):
+    """Expression for a variant's stored name, or the upload's until it exists, for ``values()``."""
+    if variant == 'full':
+        return F('image')
+    return Coalesce(NullIf(variant, Value('')), 'image', output_field=CharField())
+
+def process_photo(photo_id):
+    """Write the size variants of an uploaded photo.
+
+    Runs on the background pool after upload. Orientation from EXIF is
+    applied to the pixels and every other tag dropped, then each variant is
+    encoded from the result. The upload itself is replaced by the ``full``
+    variant, so no copy with location data is kept.
+    """
+    photo = UserPhoto.objects.filter(pk=photo_id).first()
+    if photo is None or not photo.image or photo.thumb:
+        return
+    storage = photo.image.storage
+    original = photo.image.name
+
+    with storage.open(original) as stored:
+        with Image.open(stored) as image:
+            image = ImageOps.exif_transpose(image).convert('RGB')
+
+    base = os.path.splitext(original)[0]
+    names = {}
+    for variant, (size, crop) in VARIANTS.items():
+        if crop:
+            resized = ImageOps.fit(image, size, Image.Resampling.LANCZOS, centering=(0.5, 0.4))
+        else:
+            resized = image.copy()
+            resized.thumbnail(size, Image.Resampling.LANCZOS)
+        buffer = BytesIO()
+        resized.save(buffer, VARIANT_FORMAT, quality=VARIANT_QUALITY)
+        names[variant] = storage.save(f"{base}_{variant}.{VARIANT_EXTENSION}", ContentFile(buffer.getvalue()))
+
+    if UserPhoto.objects.filter(pk=photo_id, image=original).update(
+        image=names['full'], thumb=names['thumb'], card=names['card']
+    ):
+        storage.delete(original)
+    else:
+        # Deleted or replaced meanwhile
+        for name in names.values():
+            storage.delete(name)
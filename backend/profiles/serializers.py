@@ -1,6 +1,7 @@
 
 from rest_framework import serializers
 from .models import Profile, Interest, UserPhoto
+from reports.content_filter import content_filter
 
 class InterestSerializer(serializers.ModelSerializer):
     class Meta:
@@ -10,8 +11,8 @@ class InterestSerializer(serializers.ModelSerializer):
 class UserPhotoSerializer(serializers.ModelSerializer):
     class Meta:
         model = UserPhoto
-        fields = ('id', 'image', 'is_primary', 'is_approved')
-        read_only_fields = ('is_approved',)
+        fields = ('id', 'image', 'thumb', 'card', 'is_primary', 'is_approved')
+        read_only_fields = ('thumb', 'card', 'is_approved')
 
 class ProfileSerializer(serializers.ModelSerializer):
     interests = InterestSerializer(many=True, read_only=True)
@@ -31,6 +32,12 @@ class ProfileSerializer(serializers.ModelSerializer):
              raise serializers.ValidationError("You must be at least 18 years old.")
         return value
 
+    def validate_bio(self, value):
+        error = content_filter.error(value)
+        if error:
+            raise serializers.ValidationError(error)
+        return value
+
     class Meta:
         model = Profile
         fields = (
@@ -1,3 +1,112 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from io import BytesIO
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+from users.models import User
+from matches.models import Match
+from matches.discovery import build_cards
+from chat.models import ChatMessage
+from .models import UserPhoto
+from .photos import process_photo, VARIANT_FORMAT
 
-# Create your tests here.
+class ProfileBioTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='me@example.com', password='pass1234')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_bio_runs_through_content_filter(self):
+        res = self.client.patch('/api/profile/', {'bio': 'DM me on insta @someone'}, format='json')
+        self.assertEqual(res.status_code, 400)
+        self.assertIn('bio', res.data)
+
+        res = self.client.patch('/api/profile/', {'bio': 'Coffee, books and long walks'}, format='json')
+        self.assertEqual(res.status_code, 200)
+
+class PhotoPipelineTests(TestCase):
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        self.enterContext(override_settings(MEDIA_ROOT=media))
+        self.user = User.objects.create_user(email='me@example.com', password='pass1234')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def jpeg(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees clockwise to display
+        exif[0x010F] = 'PhoneMaker'
+        buffer = BytesIO()
+        Image.new('RGB', (2000, 1000), 'red').save(buffer, 'JPEG', exif=exif)
+        return SimpleUploadedFile('me.jpg', buffer.getvalue(), content_type='image/jpeg')
+
+    def upload(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            res = self.client.post('/api/photos/', {'image': self.jpeg(), 'is_primary': True}, format='multipart')
+        self.assertEqual(res.status_code, 201)
+        # Variants are left to the background pool
+        self.assertEqual(len(callbacks), 1)
+        return UserPhoto.objects.get(pk=res.data['id'])
+
+    def test_variants_are_downscaled_without_exif(self):
+        photo = self.upload()
+        original = photo.image.name
+        process_photo(photo.id)
+        photo.refresh_from_db()
+
+        sizes = {}
+        for variant in ('thumb', 'card', 'image'):
+            with getattr(photo, variant).open() as f, Image.open(f) as image:
+                self.assertEqual(image.format, VARIANT_FORMAT)
+                self.assertFalse(image.getexif())
+                sizes[variant] = image.size
+        # Orientation is applied before resizing
+        self.assertEqual(sizes, {'thumb': (192, 192), 'card': (480, 960), 'image': (800, 1600)})
+        self.assertFalse(photo.image.storage.exists(original))
+
+    def test_replacing_the_image_redoes_the_variants(self):
+        photo = self.upload()
+        process_photo(photo.id)
+        photo.refresh_from_db()
+        stale = [photo.image.name, photo.thumb.name, photo.card.name]
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            res = self.client.patch(f'/api/photos/{photo.id}/', {'image': self.jpeg()}, format='multipart')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(callbacks), 1)
+        photo.refresh_from_db()
+        self.assertFalse(photo.thumb)
+        self.assertFalse(photo.card)
+        self.assertFalse(any(photo.image.storage.exists(name) for name in stale))
+
+        process_photo(photo.id)
+        photo.refresh_from_db()
+        self.assertTrue(all(field.storage.exists(field.name) for field in (photo.image, photo.thumb, photo.card)))
+
+    def test_updating_other_fields_keeps_the_variants(self):
+        photo = self.upload()
+        process_photo(photo.id)
+        photo.refresh_from_db()
+        with self.captureOnCommitCallbacks() as callbacks:
+            res = self.client.patch(f'/api/photos/{photo.id}/', {'is_primary': False}, format='json')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(callbacks, [])
+        self.assertEqual(UserPhoto.objects.get(pk=photo.id).thumb.name, photo.thumb.name)
+
+    def test_lists_use_the_smaller_variants(self):
+        partner = User.objects.create_user(email='partner@example.com', password='pass1234')
+        Match.objects.create_pair(self.user, partner)
+        ChatMessage.objects.create(sender=partner, receiver=self.user, content='Hi')
+        photo = UserPhoto.objects.create(user=partner, image=self.jpeg(), is_primary=True)
+
+        # Before processing every view falls back to the upload
+        self.assertEqual(self.client.get('/api/matches/').data[0]['photo'], photo.image.url)
+
+        process_photo(photo.id)
+        photo.refresh_from_db()
+        self.assertEqual(self.client.get('/api/matches/').data[0]['photo'], photo.thumb.url)
+        self.assertEqual(self.client.get('/api/chats/').data[0]['photo'], photo.thumb.url)
+        self.assertEqual(build_cards([(partner.id, 1)])[0]['photos'], [photo.card.url])
@@ -2,6 +2,8 @@
 from rest_framework import generics, permissions, viewsets
 from .models import Profile, Interest, UserPhoto
 from .serializers import ProfileSerializer, InterestSerializer, UserPhotoSerializer
+from .photos import process_photo
+from dating_core import background
 from datetime import date
 
 class ProfileDetailView(generics.RetrieveUpdateAPIView):
@@ -41,4 +43,19 @@ class UserPhotoViewSet(viewsets.ModelViewSet):
         return UserPhoto.objects.filter(user=self.request.user)
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        photo = serializer.save(user=self.request.user)
+        # Variants are encoded off the request path, see profiles.photos
+        background.submit(process_photo, photo.id)
+
+    def perform_update(self, serializer):
+        if 'image' not in serializer.validated_data:
+            serializer.save()
+            return
+        # A new image makes the old file and its variants stale
+        old = serializer.instance
+        stale = [field.name for field in (old.image, old.thumb, old.card) if field]
+        storage = old.image.storage
+        photo = serializer.save(thumb='', card='')
+        for name in stale:
+            storage.delete(name)
+        background.submit(process_photo, photo.id)
@@ -0,0 +1,109 @@
+import re
+from django.conf import settings
+
+# Money requests and off-app payment or messaging apps, matched as whole words
+SCAM_PHRASES = (
+    'send money', 'send me money', 'western union', 'moneygram', 'money gram',
+    'gift card', 'gift cards', 'giftcard', 'giftcards', 'bitcoin', 'crypto',
+    'cryptocurrency', 'investment plan', 'investment opportunity', 'processing fee',
+    'customs fee', 'customs charge', 'customs charges', 'lottery',
+    'send otp', 'send the otp', 'share otp', 'share the otp', 'share your otp',
+    'bank details', 'gpay', 'g pay', 'google pay', 'phonepe', 'phone pe', 'paytm',
+    'whatsapp', 'whats app', 'telegram',
+)
+
+def phrase_pattern(phrases):
+    """Whole-word pattern for ``phrases``, shaped as a trie.
+
+    Phrases sharing a prefix share one branch, so each word start is checked
+    against one path instead of every phrase in turn.
+    """
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase.lower():
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node):
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+
+    first_chars = ''.join(sorted({re.escape(p[0].lower()) for p in phrases}))
+    # A trailing hyphen continues the word: "crypto-free" is not "crypto"
+    return rf'(?<!\w)(?=[{first_chars}])' + build(trie) + r'(?![\w-])'
+
+# Rule name -> pattern. Rules only match where the previous character is not
+# a word character. Order matters only when two rules match at the same
+# position; the earlier one is reported.
+DEFAULT_RULES = {
+    'upi': r'(?<![\w.-])[\w.-]{2,}@(?:ok(?:sbi|hdfcbank|icici|axis)|ybl|ibl|axl|apl|paytm|upi|sbi|icici|hdfcbank|axisbank)\b',
+    'email': r'(?<![\w.+-])[\w.+-]+@[\w-]+(?:\.[\w-]+)+',
+    'handle': r'(?<![\w@])@[a-z0-9_.]{2,}',
+    # A bare domain's TLD must be lowercase, so "there.In 10 mins" is a
+    # sentence while an auto-capitalised "Instagram.com" is still a link.
+    # TLDs that are also words ("kochi.in the evening") need a path or the
+    # end of the text.
+    'url': r'(?:https?://|www\.)\S+|\b[a-z0-9-]+\.(?-i:(?:com|net|org|io|xyz|gg)(?=[/\s]|$)'
+           r'|(?:in|me|co|app|link|ly)(?=/|$))(?:/\S*)?',
+    'phone': r'(?<![\w+])\+?\d(?:[\s.-]?\d){9,12}(?!\w)',
+    'scam': phrase_pattern(SCAM_PHRASES),
+}
+
+# Message shown to the sender for each rule
+RULE_MESSAGES = {
+    'upi': "Payment details are not allowed for safety.",
+    'email': "External links and emails are not allowed for safety.",
+    'handle': "External links and emails are not allowed for safety.",
+    'url': "External links and emails are not allowed for safety.",
+    'phone': "Phone numbers are not allowed for safety.",
+    'scam': "Requests for money or moving off the app are not allowed for safety.",
+}
+
+class ContentFilter:
+    """All rules compiled into one alternation of named groups.
+
+    Any text is scanned once regardless of how many rules are enabled. The
+    shared lookbehind rejects positions inside a word before any rule is tried.
+    """
+
+    def __init__(self, rules):
+        self.rules = dict(rules)
+        self.pattern = re.compile(
+            r'(?<!\w)(?:' + '|'.join(f'(?P<{name}>{pattern})' for name, pattern in self.rules.items()) + ')',
+            re.IGNORECASE
+        )
+
+    def first_violation(self, text):
+        """Name of the first rule that matches ``text``, or None."""
+        if not text:
+            return None
+        match = self.pattern.search(text)
+        return match.lastgroup if match else None
+
+    def violations(self, text):
+        """Names of every rule that matches somewhere in ``text``."""
+        if not text:
+            return []
+        found = []
+        for match in self.pattern.finditer(text):
+            if match.lastgroup not in found:
+                found.append(match.lastgroup)
+        return found
+
+    def error(self, text):
+        """User-facing reason ``text`` is rejected, or None."""
+        rule = self.first_violation(text)
+        return RULE_MESSAGES.get(rule, "This content is not allowed for safety.") if rule else None
+
+def _enabled_rules():
+    # settings.CONTENT_FILTER_RULES may narrow the rule set by name
+    names = getattr(settings, 'CONTENT_FILTER_RULES', None)
+    if names is None:
+        return DEFAULT_RULES
+    return {name: DEFAULT_RULES[name] for name in names}
+
+content_filter = ContentFilter(_enabled_rules())
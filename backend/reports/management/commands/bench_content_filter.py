@@ -0,0 +1,60 @@
+import random
+import re
+import time
+from django.core.management.base import BaseCommand
+from reports.content_filter import content_filter
+
+CLEAN = [
+    'Hi! How was your day?', 'Did you watch the match yesterday?', 'I love the beach at Kovalam',
+    "Let's grab a coffee this weekend", 'Haha that is so true', 'What kind of music do you like?',
+    'My sister is visiting next week', 'Good night, talk tomorrow', 'Movie at 7.30?',
+    'I just finished work, so tired', 'Which district are you from?', 'Biryani or porotta and beef?',
+]
+UNSAFE = [
+    'check https://example.com/profile', 'mail me someone@example.com', 'insta @some.handle',
+    'call me 98765 43210', 'send to rahul@okhdfcbank', 'just gpay me 500', 'text me on telegram',
+]
+
+class Command(BaseCommand):
+    help = 'Compares one pass of the combined content filter with one regex search per rule'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=50000)
+        parser.add_argument('--unsafe-ratio', type=float, default=0.05)
+        parser.add_argument('--rounds', type=int, default=3)
+
+    def handle(self, *args, **options):
+        rnd = random.Random(0)
+        corpus = []
+        for _ in range(options['messages']):
+            words = rnd.sample(CLEAN, rnd.randint(1, 3))
+            if rnd.random() < options['unsafe_ratio']:
+                words.insert(rnd.randrange(len(words) + 1), rnd.choice(UNSAFE))
+            corpus.append(' '.join(words))
+
+        # What adding rules as separate checks would cost: one scan per rule
+        separate = [(name, re.compile(pattern, re.IGNORECASE)) for name, pattern in content_filter.rules.items()]
+
+        def per_rule(text):
+            hits = [(m.start(), name) for name, p in separate for m in [p.search(text)] if m]
+            return min(hits)[1] if hits else None
+
+        results = {}
+        timings = {}
+        for label, check in (('Per rule', per_rule), ('Combined', content_filter.first_violation)):
+            start = time.perf_counter()
+            for _ in range(options['rounds']):
+                results[label] = [check(text) for text in corpus]
+            timings[label] = (time.perf_counter() - start) / options['rounds']
+
+        flagged = {label: sum(r is not None for r in rs) for label, rs in results.items()}
+        if flagged['Per rule'] != flagged['Combined']:
+            self.stdout.write(self.style.ERROR(f'Flagged counts differ: {flagged}'))
+            return
+
+        n = len(corpus)
+        for label, elapsed in timings.items():
+            self.stdout.write(f'{label}: {elapsed * 1000:.1f} ms per {n} messages ({n / elapsed:,.0f} msg/s)')
+        self.stdout.write(self.style.SUCCESS(
+            f"Speedup: {timings['Per rule'] / timings['Combined']:.1f}x, {flagged['Combined']} messages flagged by both"
+        ))
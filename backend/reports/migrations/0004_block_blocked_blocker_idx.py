@@ -0,0 +1,19 @@
+# Generated by Django 6.0.1 on 2026-10-18 12:22
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0003_block'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='block',
+            index=models.Index(fields=['blocked_user', 'blocker'], name='block_blocked_blocker_idx'),
+        ),
+    ]
@@ -30,6 +30,10 @@ class Block(models.Model):
     
     class Meta:
         unique_together = ('blocker', 'blocked_user')
+        indexes = [
+            # Reverse direction of the unique index, for "who blocked me" lookups
+            models.Index(fields=['blocked_user', 'blocker'], name='block_blocked_blocker_idx'),
+        ]
 
     def __str__(self):
         return f"{self.blocker} blocked {self.blocked_user}"
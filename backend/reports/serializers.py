@@ -1,12 +1,19 @@
 from rest_framework import serializers
 from .models import Report, Block
+from .content_filter import content_filter
 
 class ReportSerializer(serializers.ModelSerializer):
+    # Content-filter rules the explanation trips (links, phone numbers, scam phrases...), for moderators
+    explanation_flags = serializers.SerializerMethodField()
+
     class Meta:
         model = Report
-        fields = ('id', 'reported_user', 'reason', 'explanation', 'created_at')
+        fields = ('id', 'reported_user', 'reason', 'explanation', 'explanation_flags', 'created_at')
         read_only_fields = ('reporter', 'created_at')
 
+    def get_explanation_flags(self, obj):
+        return content_filter.violations(obj.explanation)
+
     def create(self, validated_data):
         validated_data['reporter'] = self.context['request'].user
         return super().create(validated_data)
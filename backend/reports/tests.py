@@ -1,3 +1,66 @@
 from django.test import TestCase
+from rest_framework.test import APIClient
+from users.models import User
+from .content_filter import ContentFilter, DEFAULT_RULES, content_filter
+from .models import Report
 
-# Create your tests here.
+class ContentFilterTests(TestCase):
+    def test_rules(self):
+        cases = {
+            'visit https://example.com now': 'url',
+            'check www.example.com': 'url',
+            'my site is mallu.in': 'url',
+            'see mallu.in/profile now': 'url',
+            'Instagram.com/x': 'url',
+            'Example.com': 'url',
+            'Find me on Snapchat.com': 'url',
+            'Mallu.in/raj': 'url',
+            'HTTPS://EXAMPLE.COM': 'url',
+            'just share the OTP': 'scam',
+            'mail me at someone@example.com': 'email',
+            'insta @some.handle': 'handle',
+            'call 98765 43210': 'phone',
+            'ring +91-9876543210 tonight': 'phone',
+            'pay to rahul.k@okhdfcbank please': 'upi',
+            'just gpay me': 'scam',
+            'Send money via Western Union': 'scam',
+            'text me on WhatsApp': 'scam',
+        }
+        for text, rule in cases.items():
+            with self.subTest(text=text):
+                self.assertEqual(content_filter.first_violation(text), rule)
+
+    def test_clean_messages_pass(self):
+        for text in ('Hi! How was your day?', "Let's meet at 5 @ the cafe", "I'm 25 and 170cm", 'Movie at 7.30?', ''):
+            with self.subTest(text=text):
+                self.assertIsNone(content_filter.first_violation(text))
+
+    def test_lookalikes_pass(self):
+        cases = (
+            'See you there.In 10 mins', 'I am from kochi.in the evening', 'ok.me too',
+            'Looking for something crypto-free', 'I got the otp today',
+        )
+        for text in cases:
+            with self.subTest(text=text):
+                self.assertIsNone(content_filter.first_violation(text))
+
+    def test_violations_lists_each_rule_once(self):
+        text = 'call 9876543210 or 9876543211, or see example.com'
+        self.assertEqual(content_filter.violations(text), ['phone', 'url'])
+
+    def test_rule_set_is_configurable(self):
+        phones_only = ContentFilter({'phone': DEFAULT_RULES['phone']})
+        self.assertIsNone(phones_only.first_violation('see example.com'))
+        self.assertEqual(phones_only.first_violation('9876543210'), 'phone')
+
+class ReportFlagTests(TestCase):
+    def test_admin_report_list_flags_explanations(self):
+        admin = User.objects.create_superuser(email='admin@example.com', password='pass1234')
+        reporter = User.objects.create_user(email='me@example.com', password='pass1234')
+        reported = User.objects.create_user(email='them@example.com', password='pass1234')
+        Report.objects.create(reporter=reporter, reported_user=reported, reason='scam', explanation='Asked for a gift card, gave 9876543210')
+
+        client = APIClient()
+        client.force_authenticate(admin)
+        res = client.get('/api/admin/reports/')
+        self.assertEqual(res.data[0]['explanation_flags'], ['scam', 'phone'])
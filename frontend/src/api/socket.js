@@ -0,0 +1,14 @@
+// Interval between presence heartbeats on an open chat socket (server TTL is 60s)
+export const HEARTBEAT_MS = 25000;
+
+// Websocket URL for the chat consumer, derived from the API base URL
+export const chatSocketUrl = (token) => {
+    const apiBase = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000/api';
+    let wsUrl = apiBase.replace('http', 'ws').replace('/api', '') + '/ws/chat/?token=' + token;
+    try {
+        const url = new URL(apiBase);
+        const protocol = url.protocol === 'https:' ? 'wss:' : 'ws:';
+        wsUrl = `${protocol}//${url.host}/ws/chat/?token=${token}`;
+    } catch (e) { }
+    return wsUrl;
+};
@@ -2,6 +2,7 @@
 import React, { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import api from '../api/client';
+import { chatSocketUrl, HEARTBEAT_MS } from '../api/socket';
 import { toast } from 'react-toastify';
 import { Search, MoreHorizontal } from 'lucide-react';
 import { motion } from 'framer-motion';
@@ -12,27 +13,99 @@ const ChatList = () => {
     const prevChatsRef = useRef([]);
     const [searchQuery, setSearchQuery] = useState('');
 
+    const serverTimeRef = useRef(null);
+    const [presence, setPresence] = useState({});
+
     useEffect(() => {
         fetchChats();
-        const interval = setInterval(fetchChats, 3000);
-        return () => clearInterval(interval);
+
+        // Conversation changes are pushed over the chat socket instead of polled
+        const token = localStorage.getItem('token');
+        let ws = null;
+        let reconnectTimer = null;
+        let isUnmounting = false;
+        let hasConnected = false;
+
+        const connectWebSocket = () => {
+            if (!token || isUnmounting) return;
+            ws = new WebSocket(chatSocketUrl(token));
+
+            // After a reconnect, catch up on whatever changed while we were away
+            ws.onopen = () => {
+                if (hasConnected) fetchChats(serverTimeRef.current);
+                hasConnected = true;
+            };
+
+            ws.onmessage = (event) => {
+                const data = JSON.parse(event.data);
+                if (data.type !== 'inbox_update') return;
+                const update = data.conversation;
+                const known = prevChatsRef.current.find(c => c.user_id === update.user_id);
+                // A new conversation needs name and photo, fetch just that row set
+                if (!known) { fetchChats(serverTimeRef.current); return; }
+                applyChats([{ ...known, ...update }]);
+            };
+
+            ws.onclose = () => {
+                if (!isUnmounting) reconnectTimer = setTimeout(connectWebSocket, 3000);
+            };
+        };
+        connectWebSocket();
+
+        // Keep ourselves online and refresh who else is
+        const heartbeat = setInterval(() => {
+            if (ws && ws.readyState === WebSocket.OPEN) ws.send(JSON.stringify({ type: 'heartbeat' }));
+            fetchPresence();
+        }, HEARTBEAT_MS);
+
+        return () => {
+            isUnmounting = true;
+            clearInterval(heartbeat);
+            if (reconnectTimer) clearTimeout(reconnectTimer);
+            if (ws) ws.close();
+        };
     }, []);
 
-    const fetchChats = async () => {
+    // Merge changed conversations into the list, most recent first
+    const applyChats = (changed) => {
+        // Notify new messages
+        changed.forEach(nc => {
+            const old = prevChatsRef.current.find(oc => oc.user_id === nc.user_id);
+            if (nc.unread_count > (old?.unread_count || 0)) {
+                toast.info(`New message from ${nc.name}`, { icon: '💬' });
+            }
+        });
+
+        const ids = new Set(changed.map(c => c.user_id));
+        const merged = [...changed, ...prevChatsRef.current.filter(c => !ids.has(c.user_id))]
+            .sort((a, b) => new Date(b.time) - new Date(a.time));
+        setChats(merged);
+        prevChatsRef.current = merged;
+    };
+
+    const fetchPresence = async (chatList = prevChatsRef.current) => {
+        if (!chatList.length) return;
         try {
-            const res = await api.get('/chats/');
-            const newChats = res.data;
-
-            // Notify new messages
-            newChats.forEach(nc => {
-                const old = prevChatsRef.current.find(oc => oc.user_id === nc.user_id);
-                if (nc.unread_count > (old?.unread_count || 0)) {
-                    toast.info(`New message from ${nc.name}`, { icon: '💬' });
-                }
-            });
-
-            setChats(newChats);
-            prevChatsRef.current = newChats;
+            const ids = chatList.slice(0, 100).map(c => c.user_id).join(',');
+            const res = await api.get(`/presence/?user_ids=${ids}`);
+            setPresence(res.data);
+        } catch (err) { }
+    };
+
+    const fetchChats = async (since) => {
+        try {
+            if (since) {
+                const res = await api.get(`/chats/?since=${encodeURIComponent(since)}`);
+                serverTimeRef.current = res.data.server_time;
+                applyChats(res.data.results);
+            } else {
+                const res = await api.get('/chats/');
+                // Catch-up calls start from the newest message we have seen (server clock)
+                serverTimeRef.current = res.data[0]?.time || null;
+                setChats(res.data);
+                prevChatsRef.current = res.data;
+                fetchPresence(res.data);
+            }
         } catch (err) {
             console.error(err);
         }
@@ -83,10 +156,13 @@ const ChatList = () => {
                                 className="w-16 h-16 rounded-full object-cover bg-slate-100 ring-2 ring-white shadow-sm group-hover:ring-rose-100 transition-all"
                                 alt=""
                             />
-                            {/* Online Status Dot (Simulated for now if not in data, or use unread indicator logic) */}
                             {chat.unread_count > 0 && (
                                 <span className="absolute top-0 right-0 w-4 h-4 bg-rose-500 rounded-full border-2 border-white"></span>
                             )}
+                            {/* Online Status Dot */}
+                            {presence[chat.user_id]?.is_online && (
+                                <span className="absolute bottom-0 right-0 w-4 h-4 bg-green-500 rounded-full border-2 border-white"></span>
+                            )}
                         </div>
 
                         <div className="flex-1 min-w-0">
@@ -3,6 +3,7 @@ import React, { useState, useEffect, useRef } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import { ChevronLeft, Send, Mic, Phone, PhoneIncoming, PhoneOff, MoreVertical, X, AlertTriangle, Ban, ChevronDown, Volume2, MicOff, Video, Image as ImageIcon, Smile, Check, CheckCheck } from 'lucide-react';
 import api from '../api/client';
+import { chatSocketUrl, HEARTBEAT_MS } from '../api/socket';
 import { toast } from 'react-toastify';
 import { motion, AnimatePresence } from 'framer-motion';
 import { Peer } from 'peerjs';
@@ -26,6 +27,7 @@ const ChatWindow = () => {
     const [connectionStep, setConnectionStep] = useState('');
     const [activeCallId, setActiveCallId] = useState(null);
     const [isMuted, setIsMuted] = useState(false);
+    const callStatusRef = useRef(null);
 
     // Refs
     const peerRef = useRef(null);
@@ -40,6 +42,9 @@ const ChatWindow = () => {
     const [partnerStatus, setPartnerStatus] = useState(null);
     const [replyTo, setReplyTo] = useState(null);
     const [showScrollButton, setShowScrollButton] = useState(false);
+    const [hasMore, setHasMore] = useState(false);
+    const messagesRef = useRef([]);
+    const loadingOlderRef = useRef(false);
     const lastTypedRef = useRef(0);
     const typingTimeoutRef = useRef(null);
     const scrollRef = useRef();
@@ -48,6 +53,8 @@ const ChatWindow = () => {
     const [wsStatus, setWsStatus] = useState('connecting'); // connecting, connected, disconnected
 
     useEffect(() => {
+        messagesRef.current = [];
+        setMessages([]);
         fetchMessages();
         fetchOtherUser();
 
@@ -93,15 +100,8 @@ const ChatWindow = () => {
         const connectWebSocket = () => {
             if (!token || isUnmounting) return;
 
-            // Robust URL Calculation
-            const apiBase = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000/api';
-            let wsUrl = apiBase.replace('http', 'ws').replace('/api', '') + '/ws/chat/?token=' + token;
-            try {
-                const url = new URL(apiBase);
-                const protocol = url.protocol === 'https:' ? 'wss:' : 'ws:';
-                wsUrl = `${protocol}//${url.host}/ws/chat/?token=${token}`;
-                console.log("Connecting WS to:", wsUrl);
-            } catch (e) { }
+            const wsUrl = chatSocketUrl(token);
+            console.log("Connecting WS to:", wsUrl);
 
             ws = new WebSocket(wsUrl);
             wsRef.current = ws;
@@ -109,6 +109,9 @@ const ChatWindow = () => {
             ws.onopen = () => {
                 console.log("Connected to Chat WebSocket");
                 setWsStatus('connected');
+                // Catch up on anything sent while we were disconnected
+                fetchMessages();
+                pollCalls();
             };
 
             ws.onmessage = (event) => {
@@ -128,7 +131,37 @@ const ChatWindow = () => {
                     return;
                 }
 
-                // 2. Chat Message
+                // 2. Call signaling
+                if (data.type === 'call') {
+                    applyCallUpdate({ [data.kind]: data.call });
+                    return;
+                }
+
+                // 3. Partner has read our messages up to last_read_id
+                if (data.type === 'read_receipt') {
+                    if (data.user_id === parseInt(userId)) {
+                        setMessages(prev => prev.map(m =>
+                            m.sender === myId && !m.is_read && m.id <= data.last_read_id ? { ...m, is_read: true } : m
+                        ));
+                    }
+                    return;
+                }
+
+                // 4. Ack / rejection of a message we sent over the socket
+                if (data.type === 'ack') {
+                    const realMsg = data.message;
+                    setMessages(prev => prev.some(m => m.id === realMsg.id)
+                        ? prev.filter(m => m.id !== data.client_id)
+                        : prev.map(m => m.id === data.client_id ? realMsg : m));
+                    return;
+                }
+                if (data.type === 'error') {
+                    setMessages(prev => prev.filter(m => m.id !== data.client_id));
+                    toast.error(typeof data.error === 'string' ? data.error : "Send failed");
+                    return;
+                }
+
+                // 5. Chat Message
                 if (data.message) {
                     const newMsg = data.message;
                     const partnerId = parseInt(userId);
@@ -154,6 +187,11 @@ const ChatWindow = () => {
                         });
 
                         setPartnerStatus(prev => ({ ...prev, is_typing: false }));
+
+                        // The chat is open, so the partner's message is read now
+                        if (newMsg.sender === partnerId) {
+                            ws.send(JSON.stringify({ type: 'read', user_id: partnerId, last_read_id: newMsg.id }));
+                        }
                     }
                 }
             };
@@ -171,16 +209,27 @@ const ChatWindow = () => {
 
         if (token) connectWebSocket();
 
-        // 3. Fallback Polling & Status Sync
-        // Poll every 3s to ensure messages load even if WS fails, and to update 'Active Now' status
+        // 3. Fallback Polling
+        // Messages and call signaling arrive over the socket; only poll while it is down
         const interval = setInterval(() => {
-            pollCalls();
-            fetchMessages();
+            if (!wsRef.current || wsRef.current.readyState !== WebSocket.OPEN) {
+                pollCalls();
+                fetchMessages();
+            }
         }, 3000);
 
+        // 4. Presence: keep ourselves online, refresh the partner's status
+        const heartbeat = setInterval(() => {
+            if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
+                wsRef.current.send(JSON.stringify({ type: 'heartbeat' }));
+            }
+            fetchPartnerPresence();
+        }, HEARTBEAT_MS);
+
         return () => {
             isUnmounting = true;
             clearInterval(interval);
+            clearInterval(heartbeat);
             if (reconnectTimer) clearTimeout(reconnectTimer);
             if (ws) ws.close();
             stopRingtone();
@@ -189,6 +238,8 @@ const ChatWindow = () => {
         };
     }, [userId, myId]);
 
+    useEffect(() => { messagesRef.current = messages; }, [messages]);
+    useEffect(() => { callStatusRef.current = callStatus; }, [callStatus]);
     useEffect(() => { if (!showScrollButton) scrollToBottom(); }, [messages, replyTo]);
 
     // Ringtone Logic - Sweet & Mild
@@ -277,25 +328,30 @@ const ChatWindow = () => {
         if (audioCtxRef.current) { audioCtxRef.current.close().catch(() => { }); audioCtxRef.current = null; }
     };
 
+    // Call signaling arrives over the socket ({kind: call}); poll is the fallback
+    const applyCallUpdate = (data) => {
+        const status = callStatusRef.current;
+        if (data.incoming && !status) {
+            setCallStatus('incoming');
+            setActiveCallId(data.incoming.id);
+            startRingtone('incoming');
+        }
+        if (data.my_call) {
+            const call = data.my_call;
+            if (call.status === 'active' && status === 'dialing') {
+                setConnectionStep("Connecting voice...");
+                stopRingtone();
+            }
+            if (['ended', 'rejected'].includes(call.status)) handleEndCallLocal();
+        }
+        if (data.incoming_update) {
+            if (['ended', 'rejected'].includes(data.incoming_update.status)) handleEndCallLocal();
+        }
+    };
     const pollCalls = async () => {
         try {
             const res = await api.get('/calls/poll/');
-            if (res.data.incoming && !callStatus) {
-                setCallStatus('incoming');
-                setActiveCallId(res.data.incoming.id);
-                startRingtone('incoming');
-            }
-            if (res.data.my_call) {
-                const call = res.data.my_call;
-                if (call.status === 'active' && callStatus === 'dialing') {
-                    setConnectionStep("Connecting voice...");
-                    stopRingtone();
-                }
-                if (['ended', 'rejected'].includes(call.status)) handleEndCallLocal();
-            }
-            if (res.data.incoming_update) {
-                if (['ended', 'rejected'].includes(res.data.incoming_update.status)) handleEndCallLocal();
-            }
+            applyCallUpdate(res.data);
         } catch (err) { }
     };
 
@@ -420,14 +476,55 @@ const ChatWindow = () => {
 
     // Chat Logic
     const scrollToBottom = () => scrollRef.current?.scrollIntoView({ behavior: 'smooth' });
-    const handleScroll = (e) => setShowScrollButton(e.target.scrollHeight - e.target.scrollTop - e.target.clientHeight > 300);
+    const handleScroll = (e) => {
+        setShowScrollButton(e.target.scrollHeight - e.target.scrollTop - e.target.clientHeight > 300);
+        if (e.target.scrollTop < 80) loadOlderMessages(e.target);
+    };
+    const fetchPartnerPresence = async () => {
+        try {
+            const res = await api.get(`/presence/?user_ids=${userId}`);
+            const status = res.data[userId];
+            if (status) setPartnerStatus(prev => ({ ...prev, ...status }));
+        } catch (e) { }
+    };
     const fetchOtherUser = async () => { try { const res = await api.get(`/profile/${userId}/`); setOtherUser(res.data); } catch (e) { } };
+
+    // Temp ids (Date.now()) belong to optimistic messages that are not saved yet
+    const isServerId = (id) => id < 1000000000000;
     const fetchMessages = async () => {
         try {
-            const res = await api.get(`/messages/?user_id=${userId}`);
-            if (Array.isArray(res.data)) setMessages(res.data);
-            else { setMessages(res.data.messages); setPartnerStatus(res.data.partner_status); }
+            // First load takes the latest page, later polls only ask for what is newer
+            const lastSaved = [...messagesRef.current].reverse().find(m => isServerId(m.id));
+            const url = lastSaved ? `/messages/?user_id=${userId}&after_id=${lastSaved.id}` : `/messages/?user_id=${userId}`;
+            const res = await api.get(url);
+            setPartnerStatus(res.data.partner_status);
+            if (lastSaved) {
+                const newer = res.data.messages;
+                if (newer.length) {
+                    setMessages(prev => [...prev, ...newer.filter(m => !prev.some(p => p.id === m.id))]);
+                    messagesRef.current = [...messagesRef.current, ...newer];
+                }
+                if (res.data.has_more) fetchMessages();
+            } else {
+                setMessages(res.data.messages);
+                messagesRef.current = res.data.messages;
+                setHasMore(res.data.has_more);
+            }
+        } catch (e) { }
+    };
+    const loadOlderMessages = async (container) => {
+        const firstSaved = messagesRef.current.find(m => isServerId(m.id));
+        if (!hasMore || !firstSaved || loadingOlderRef.current) return;
+        loadingOlderRef.current = true;
+        const prevHeight = container.scrollHeight;
+        try {
+            const res = await api.get(`/messages/?user_id=${userId}&before_id=${firstSaved.id}`);
+            setHasMore(res.data.has_more);
+            setMessages(prev => [...res.data.messages.filter(m => !prev.some(p => p.id === m.id)), ...prev]);
+            // Keep the message the user was looking at in place
+            requestAnimationFrame(() => { container.scrollTop += container.scrollHeight - prevHeight; });
         } catch (e) { }
+        loadingOlderRef.current = false;
     };
     const handleInput = (e) => {
         setInput(e.target.value);
@@ -468,6 +565,13 @@ const ChatWindow = () => {
             setTimeout(scrollToBottom, 50);
 
             const payload = { receiver: userId, content: msgContent, message_type: 'text', parent_message: replyTo?.id };
+
+            // Open socket: send over it, the server acks with the saved message
+            if (wsRef.current && wsRef.current.readyState === WebSocket.OPEN) {
+                wsRef.current.send(JSON.stringify({ type: 'send_message', client_id: tempId, ...payload }));
+                return;
+            }
+
             const res = await api.post('/messages/', payload);
             const realMsg = res.data;
 
@@ -65,6 +65,8 @@ const Discovery = () => {
     const [users, setUsers] = useState([]);
     const [currentIndex, setCurrentIndex] = useState(0);
     const [loading, setLoading] = useState(true);
+    const [cursor, setCursor] = useState(null);
+    const [fetchingMore, setFetchingMore] = useState(false);
 
     const [profileCompleted, setProfileCompleted] = useState(true);
 
@@ -86,10 +88,12 @@ const Discovery = () => {
         } catch (err) { }
     };
 
+    // Fresh deck: the server ranks once and hands out pages via the cursor
     const fetchDiscovery = async () => {
         try {
-            const res = await api.get('/discovery/');
-            setUsers(res.data);
+            const res = await api.get('/discovery/deck/');
+            setUsers(res.data.results);
+            setCursor(res.data.cursor);
             setLoading(false);
         } catch (err) {
             console.error(err);
@@ -97,6 +101,28 @@ const Discovery = () => {
         }
     };
 
+    const fetchNextPage = async () => {
+        if (!cursor || fetchingMore) return;
+        setFetchingMore(true);
+        try {
+            const res = await api.get('/discovery/deck/', { params: { cursor } });
+            setUsers(prev => {
+                const seen = new Set(prev.map(u => u.user_id));
+                return [...prev, ...res.data.results.filter(u => !seen.has(u.user_id))];
+            });
+            setCursor(res.data.cursor);
+        } catch (err) {
+            console.error(err);
+        } finally {
+            setFetchingMore(false);
+        }
+    };
+
+    // Top up the stack before the last card is swiped
+    useEffect(() => {
+        if (!loading && users.length - currentIndex <= 3) fetchNextPage();
+    }, [currentIndex, users.length, loading]);
+
     const handleSwipe = async (targetId, action) => {
         try {
             const res = await api.post('/swipe/', { target_id: targetId, action });